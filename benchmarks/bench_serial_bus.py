@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+'''SerialBus & translator throughput/latency benchmark over pty loopback pairs (POSIX).
+
+Peer end of the pty is driven by a forked process, so CPU per byte is the cost of pqcom side only.
+Data are frames of --chunk bytes: sequence number, monotonic send timestamp ns & padding.
+
+Example:
+	python benchmarks/bench_serial_bus.py --duration 2 --chunk 256 --rate 1000000 --io selector
+'''
+
+from typing import Dict, List
+
+import os
+import sys
+import tty
+import json
+import time
+import struct
+import argparse
+import threading
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pqcom import serial_bus
+from pqcom import pqcom_translator as translator
+
+
+FRAME_HEADER = struct.Struct('<QQ')
+BENCHMARKS = ('rx', 'tx', 'translator')
+
+
+def pty_pair():
+	'Gets (peer fd, port name)'
+	peer, port = os.openpty()
+	tty.setraw(port)
+	tty.setraw(peer)
+	name = os.ttyname(port)
+	os.close(port)
+	return peer, name
+
+def make_frame(seq: int, size: int) -> bytes:
+	return FRAME_HEADER.pack(seq, time.monotonic_ns()).ljust(size, b'\x55')
+
+def percentiles(values: List[int]) -> Dict[str, float]:
+	'Gets latency percentiles, us'
+	if not values:
+		return {}
+	values = sorted(values)
+	return {'p{}'.format(p): values[min(len(values) - 1, len(values) * p // 100)] / 1000.0
+		for p in (50, 90, 99, 100)}
+
+def pace(deadline: float, period: float) -> float:
+	'Sleeps till the deadline; gets the next one'
+	delay = deadline - time.perf_counter()
+	if delay > 0:
+		time.sleep(delay)
+	return deadline + period
+
+
+class FrameParser(object):
+	'Cuts stream to frames; collects latencies & sequence gaps'
+
+	def __init__(self, size: int):
+		self.size = size
+		self.buffer = bytearray()
+		self.frames = 0
+		self.lost = 0
+		self.next_seq = 0
+		self.latencies: List[int] = []
+		self.read_latencies: List[int] = []
+
+	def feed(self, data, now_ns: int, read_ns: int=0):
+		'now_ns: consumer time, read_ns: RX thread timestamp of the chunk'
+		self.buffer += data
+		end = len(self.buffer) - len(self.buffer) % self.size
+		for offset in range(0, end, self.size):
+			seq, sent_ns = FRAME_HEADER.unpack_from(self.buffer, offset)
+			if seq > self.next_seq:
+				self.lost += seq - self.next_seq
+			self.next_seq = seq + 1
+			self.frames += 1
+			self.latencies.append(now_ns - sent_ns)
+			if read_ns:
+				self.read_latencies.append(read_ns - sent_ns)
+		del self.buffer[:end]
+
+
+def peer_writer(peer: int, chunk: int, rate: int, duration: float):
+	'Forked: writes frames to pty peer at rate, bytes/s (0: unlimited)'
+	period = chunk / rate if rate else 0
+	deadline = time.perf_counter()
+	end = deadline + duration
+	seq = 0
+	while time.perf_counter() < end:
+		os.write(peer, make_frame(seq, chunk))
+		seq += 1
+		if period:
+			deadline = pace(deadline, period)
+	os._exit(0)
+
+def peer_reader(peer: int, chunk: int, duration: float, results):
+	'Forked: reads frames from pty peer; sends parsed stats back'
+	parser = FrameParser(chunk)
+	os.set_blocking(peer, False)
+	end = time.perf_counter() + duration
+	while time.perf_counter() < end:
+		try:
+			data = os.read(peer, 65536)
+		except BlockingIOError:
+			time.sleep(0.0005)
+			continue
+		parser.feed(data, time.monotonic_ns())
+	results.put((parser.frames, parser.lost, parser.latencies))
+
+def create_engine(io: str):
+	if io == 'selector':
+		from pqcom.serial_selector import SelectorEngine
+		return SelectorEngine()
+	return None
+
+def bench_rx(args) -> dict:
+	'Peer -> SerialBus -> consumer thread, like GUI display'
+	peer, name = pty_pair()
+	received = threading.Event()
+	engine = create_engine(args.io)
+	bus = serial_bus.SerialBus(received.set, None, engine)
+	bus.start(serial_bus.SerialParameters(args.baud), port_name=name)
+	parser = FrameParser(args.chunk)
+	chunks = 0
+
+	process = multiprocessing.get_context('fork').Process(target=peer_writer,
+		args=(peer, args.chunk, args.rate, args.duration))
+	cpu = time.process_time()
+	start = time.perf_counter()
+	process.start()
+	end = start + args.duration + 0.5
+	while time.perf_counter() < end:
+		if not received.wait(0.05):
+			if not process.is_alive():
+				break
+			continue
+		received.clear()
+		now_ns = time.monotonic_ns()
+		for timestamp_ns, data in bus.read_all():
+			parser.feed(data, now_ns, timestamp_ns)
+			chunks += 1
+	elapsed = time.perf_counter() - start
+	cpu = time.process_time() - cpu
+	process.join()
+	bus.join()
+	if engine:
+		engine.stop()
+	os.close(peer)
+
+	received_bytes = parser.frames * args.chunk + len(parser.buffer)
+	sent_bytes = parser.next_seq * args.chunk
+	return {'bytes_per_s': received_bytes / elapsed, 'chunks': chunks,
+		'avg_chunk': received_bytes / chunks if chunks else 0,
+		'frames': parser.frames, 'lost_frames': parser.lost, 'lost_bytes': max(0, sent_bytes - received_bytes),
+		'read_latency_us': percentiles(parser.read_latencies),
+		'latency_us': percentiles(parser.latencies),
+		'cpu_ns_per_byte': cpu * 1e9 / received_bytes if received_bytes else 0}
+
+def bench_tx(args) -> dict:
+	'SerialBus.write -> TX I/O -> peer'
+	peer, name = pty_pair()
+	engine = create_engine(args.io)
+	bus = serial_bus.SerialBus(None, None, engine)
+	bus.start(serial_bus.SerialParameters(args.baud), port_name=name)
+	context = multiprocessing.get_context('fork')
+	results = context.Queue()
+	process = context.Process(target=peer_reader, args=(peer, args.chunk, args.duration + 0.5, results))
+	process.start()
+
+	period = args.chunk / args.rate if args.rate else 0
+	cpu = time.process_time()
+	start = deadline = time.perf_counter()
+	end = start + args.duration
+	seq = 0
+	while time.perf_counter() < end:
+		bus.write(make_frame(seq, args.chunk))
+		seq += 1
+		if period:
+			deadline = pace(deadline, period)
+		elif bus.tx_queue.qsize() > 1024:
+			# unlimited rate: keep the queue bounded by the line rate
+			time.sleep(0.0005)
+	while not bus.tx_queue.empty() and time.perf_counter() < end + 0.4:
+		time.sleep(0.001)
+	elapsed = time.perf_counter() - start
+	cpu = time.process_time() - cpu
+	frames, lost, latencies = results.get()
+	process.join()
+	bus.join()
+	if engine:
+		engine.stop()
+	os.close(peer)
+
+	return {'bytes_per_s': frames * args.chunk / elapsed, 'frames': frames, 'queued_frames': seq,
+		'lost_frames': lost + max(0, seq - frames - lost),
+		'latency_us': percentiles(latencies),
+		'cpu_ns_per_byte': cpu * 1e9 / (seq * args.chunk) if seq else 0}
+
+def bench_translator(args) -> dict:
+	'Formatters throughput on random data, bytes/s'
+	data = os.urandom(args.translator_size)
+	ret = {}
+	for name, func in (('to_hex_prefix_string', translator.to_hex_prefix_string),
+			('to_rx_line', lambda data: [translator.to_rx_line(data[i:i + args.chunk], False, 0)
+				for i in range(0, len(data), args.chunk)]),
+			('to_rx_line_hex', lambda data: [translator.to_rx_line(data[i:i + args.chunk], True, 0)
+				for i in range(0, len(data), args.chunk)])):
+		start = time.perf_counter()
+		func(data)
+		ret[name] = len(data) / (time.perf_counter() - start)
+	return ret
+
+def main():
+	parser = argparse.ArgumentParser(description='SerialBus & translator benchmark over pty pairs')
+	parser.add_argument('--duration', metavar='SEC', type=float, default=2.0, help='run time of RX/TX benchmarks; default: 2')
+	parser.add_argument('--rate', metavar='BYTES_PER_S', type=int, default=0, help='peer rate; default: 0 - unlimited')
+	parser.add_argument('--chunk', metavar='BYTES', type=int, default=256, help='frame size, >= 16; default: 256')
+	parser.add_argument('--baud', type=int, default=115200, help='port baudrate (read sizing); default: 115200')
+	parser.add_argument('--io', choices=('threads', 'selector'), default='threads', help='SerialBus I/O; default: threads')
+	parser.add_argument('--translator-size', metavar='BYTES', type=int, default=1024 * 1024,
+		help='translator benchmark data size; default: 1 MiB')
+	parser.add_argument('--only', metavar='NAMES', default=','.join(BENCHMARKS),
+		help='comma separated benchmarks: ' + ', '.join(BENCHMARKS))
+	parser.add_argument('--json', action='store_true', help='print JSON')
+	args = parser.parse_args()
+	if args.chunk < FRAME_HEADER.size:
+		parser.error('--chunk is less than frame header')
+
+	results = {}
+	for name in args.only.split(','):
+		results[name] = globals()['bench_' + name](args)
+
+	if args.json:
+		print(json.dumps(results, indent=1))
+		return
+	for name, result in results.items():
+		print(name)
+		for key, value in result.items():
+			if isinstance(value, dict):
+				value = ' '.join('{}={:.1f}'.format(k, v) for k, v in value.items())
+			elif isinstance(value, float):
+				value = '{:.1f}'.format(value)
+			print('  {:<22} {}'.format(key, value))
+
+if __name__ == '__main__':
+	main()
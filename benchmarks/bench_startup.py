@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+'''Cold start benchmark: import time of pqcom modules & time to the first shown window.
+
+Each sample is a new interpreter. Exit code is 1 when a median is over its budget, so the benchmark can guard CI.
+
+Example:
+	python benchmarks/bench_startup.py --runs 5 --budget-import 150 --budget-window 500
+'''
+
+from typing import Dict, List, Tuple
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# name: code run by a new interpreter; it prints the measured time, ms
+TARGETS = {
+	'import_cli': 'import time; t = time.perf_counter(); import pqcom.cli; print((time.perf_counter() - t) * 1e3)',
+	'import_headless': 'import time, sys; t = time.perf_counter(); import pqcom.headless; '
+		'print((time.perf_counter() - t) * 1e3); assert "PyQt5" not in sys.modules',
+	'import_gui': 'import time; t = time.perf_counter(); import pqcom.main; print((time.perf_counter() - t) * 1e3)',
+	'window': 'import time; t = time.perf_counter()\n'
+		'from PyQt5.QtWidgets import QApplication\n'
+		'from pqcom import main, cli\n'
+		'app = QApplication([])\n'
+		'window = main.MainWindow(cli.parse_args([]))\n'
+		'window.show()\n'
+		'app.processEvents()\n'
+		'print((time.perf_counter() - t) * 1e3)\n'
+		'window.close()',
+}
+
+
+def run(code: str, env: Dict[str, str]) -> float:
+	out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env,
+		stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+	return float(out.stdout.split()[-1])
+
+def slowest_imports(module: str, env: Dict[str, str], count: int) -> List[Tuple[str, float]]:
+	'Gets the slowest imports (cumulative ms) by python -X importtime'
+	out = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module], cwd=ROOT, env=env,
+		stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True, universal_newlines=True)
+	ret = []
+	for line in out.stderr.splitlines()[1:]:
+		_, cumulative, name = line.split('|')
+		ret.append((name.strip(), int(cumulative) / 1e3))
+	ret.sort(key=lambda x: -x[1])
+	return ret[:count]
+
+def main():
+	parser = argparse.ArgumentParser(description='pqcom cold start benchmark')
+	parser.add_argument('--runs', type=int, default=5, help='samples per target; default: 5')
+	parser.add_argument('--only', metavar='NAMES', default=','.join(TARGETS),
+		help='comma separated targets: ' + ', '.join(TARGETS))
+	parser.add_argument('--budget-import', metavar='MS', type=float, default=150.0,
+		help='budget of GUI import median; default: 150')
+	parser.add_argument('--budget-window', metavar='MS', type=float, default=500.0,
+		help='budget of the first window median; default: 500')
+	parser.add_argument('--top', metavar='COUNT', type=int, default=10,
+		help='show the slowest imports of pqcom.main; default: 10, 0 - off')
+	parser.add_argument('--json', action='store_true', help='print JSON')
+	args = parser.parse_args()
+
+	budgets = {'import_gui': args.budget_import, 'window': args.budget_window}
+
+	results = {}
+	# the window opens ~/.pqcom.sqlite3 & imports ~/.pqcom_data3: temporary home keeps the user data untouched
+	with tempfile.TemporaryDirectory(prefix='pqcom-bench-') as home:
+		env = dict(os.environ, PYTHONPATH=ROOT, HOME=home, USERPROFILE=home)
+		env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+		for name in args.only.split(','):
+			samples = [run(TARGETS[name], env) for _ in range(args.runs)]
+			results[name] = {'median_ms': statistics.median(samples), 'min_ms': min(samples), 'max_ms': max(samples)}
+			if name in budgets:
+				results[name]['budget_ms'] = budgets[name]
+		top = slowest_imports('pqcom.main', env, args.top) if args.top else []
+
+	if args.json:
+		print(json.dumps({'results': results, 'slowest_imports_ms': top}, indent=1))
+	else:
+		for name, result in results.items():
+			print('{:<16} median {:7.1f} ms  min {:7.1f}  max {:7.1f}{}'.format(name, result['median_ms'],
+				result['min_ms'], result['max_ms'],
+				'  budget {:.0f}'.format(result['budget_ms']) if 'budget_ms' in result else ''))
+		if top:
+			print('slowest imports of pqcom.main, cumulative ms:')
+			for module, ms in top:
+				print('  {:7.1f} {}'.format(ms, module))
+	over = [name for name, result in results.items() if result['median_ms'] > result.get('budget_ms', float('inf'))]
+	if over:
+		print('over budget: ' + ', '.join(over), file=sys.stderr)
+		return 1
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
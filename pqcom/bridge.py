@@ -0,0 +1,283 @@
+'''TCP bridge of an open SerialBus: network clients watch RX and send TX of the port.
+
+RX chunks fan out to all clients as the same immutable bytes objects (RFC 2217 clients share one IAC escaped
+copy of the chunk); each client has its own bounded queue, the oldest chunks are dropped for a slow reader,
+so a client never stalls the port. Client data are written to the bus TX queue.
+
+Protocols:
+	raw                                plain bytes both ways, e.g. nc HOST PORT or socat
+	rfc2217                            Telnet RFC 2217: serial.serial_for_url('rfc2217://HOST:PORT');
+	                                   client port settings are applied to the port
+'''
+
+from typing import List, Optional, Tuple
+
+import time
+import socket
+import logging
+import selectors
+import threading
+
+import serial
+
+from pqcom import serial_bus
+from pqcom import byte_queue
+
+
+PROTOCOLS = ('raw', 'rfc2217')
+DEFAULT_HOST = '127.0.0.1'
+CLIENT_BUFFER_LIMIT = 4 * 1024 * 1024 # bytes queued per client
+RECV_SIZE = 64 * 1024
+MODEM_LINES_PERIOD = 1.0 # s; RFC 2217 modem state notifications
+MODEM_LINES = ('cts', 'dsr', 'ri', 'cd')
+CONTROL_LINES = ('dtr', 'rts', 'break_condition')
+
+IAC = b'\xff'
+IAC_DOUBLED = b'\xff\xff'
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+	'Gets (host, port) of [HOST:]PORT; raises ValueError'
+	host, _, port = address.rpartition(':')
+	return host.strip('[]') or DEFAULT_HOST, int(port)
+
+
+class PortProxy(object):
+	'Serial of the bus for RFC 2217 port manager: the bus may reopen the port'
+
+	def __init__(self, bus: serial_bus.SerialBus):
+		object.__setattr__(self, '_bus', bus)
+
+	def __getattr__(self, name):
+		port = self._bus.serial
+		if port is None:
+			raise serial.SerialException('Port is not open')
+		if name in MODEM_LINES:
+			try:
+				return getattr(port, name)
+			except OSError:
+				# pty & some adapters have no modem lines: inactive
+				return False
+		return getattr(port, name)
+
+	def __setattr__(self, name, value):
+		port = self._bus.serial
+		if port is None:
+			return
+		try:
+			setattr(port, name, value)
+		except OSError as e:
+			if name not in CONTROL_LINES:
+				raise
+			# no control lines: the client request is acknowledged anyway
+			logging.debug('Bridge: {} is not set: {}'.format(name, e))
+
+
+class BridgeClient(object):
+
+	def __init__(self, sock: socket.socket, address, limit: int):
+		self.sock = sock
+		self.name = '{}:{}'.format(*address[:2])
+		self.queue = byte_queue.ByteQueue(limit, byte_queue.DROP_OLDEST)
+		self.view: Optional[memoryview] = None # unsent rest of the chunk
+		self.manager = None # RFC 2217 port manager
+
+	def write(self, data: bytes):
+		'Queues Telnet replies of the port manager'
+		self.queue.put(bytes(data))
+
+
+class BridgeServer(object):
+	'Serves the bus to TCP clients by one selector thread'
+
+	def __init__(self, bus: serial_bus.SerialBus, host: str=DEFAULT_HOST, port: int=0, protocol: str='raw',
+			client_limit: int=CLIENT_BUFFER_LIMIT):
+		if protocol not in PROTOCOLS:
+			raise ValueError('Wrong bridge protocol: ' + protocol)
+		self.bus = bus
+		self.protocol = protocol
+		self.client_limit = client_limit
+		self._server = socket.create_server((host, port), family=socket.AF_INET6 if ':' in host else socket.AF_INET)
+		self._server.setblocking(False)
+		self.address = self._server.getsockname()[:2]
+		self._clients: Tuple[BridgeClient, ...] = () # replaced, not changed: iterated by I/O threads
+		self._selector = selectors.DefaultSelector()
+		self._wake_r, self._wake_w = socket.socketpair()
+		self._wake_r.setblocking(False)
+		self._wake_w.setblocking(False)
+		self._wake_pending = False
+		self._stopping = False
+		self._thread: Optional[threading.Thread] = None
+
+	@property
+	def clients(self) -> List[str]:
+		return [client.name for client in self._clients]
+
+	def start(self):
+		self._selector.register(self._server, selectors.EVENT_READ)
+		self._selector.register(self._wake_r, selectors.EVENT_READ)
+		self.bus.add_listener(self._on_chunk)
+		self._thread = threading.Thread(target=self._run, daemon=True)
+		self._thread.start()
+		logging.info('Bridge of {} is listening on {}:{}'.format(self.protocol, *self.address))
+
+	def stop(self):
+		self.bus.remove_listener(self._on_chunk)
+		if self._thread:
+			self._stopping = True
+			self._wake()
+			self._thread.join()
+			self._thread = None
+		for client in self._clients:
+			self._close(client)
+		self._selector.close()
+		self._server.close()
+		self._wake_r.close()
+		self._wake_w.close()
+
+	def _on_chunk(self, bus, direction: int, timestamp_ns: int, data: bytes):
+		'Bus listener in I/O thread: RX chunk is queued to all clients'
+		clients = self._clients
+		if direction != serial_bus.RX or not clients:
+			return
+		escaped = None
+		for client in clients:
+			if client.manager:
+				if escaped is None:
+					escaped = data.replace(IAC, IAC_DOUBLED)
+				client.queue.put(escaped)
+			else:
+				client.queue.put(data)
+		self._wake()
+
+	def _wake(self):
+		# one wake-up is pending regardless of RX rate
+		if not self._wake_pending:
+			self._wake_pending = True
+			try:
+				self._wake_w.send(b'\0')
+			except BlockingIOError:
+				pass
+
+	def _run(self):
+		logging.info('bridge thread is started')
+		modem_lines_time = time.monotonic()
+		while not self._stopping:
+			events = self._selector.select(MODEM_LINES_PERIOD)
+			for key, mask in events:
+				if key.fileobj is self._server:
+					self._accept()
+				elif key.fileobj is self._wake_r:
+					self._on_wake()
+				else:
+					client = key.data
+					try:
+						if mask & selectors.EVENT_READ:
+							self._on_readable(client)
+						if mask & selectors.EVENT_WRITE and client in self._clients:
+							self._on_writable(client)
+					except OSError as e:
+						logging.info('Bridge client {}: {}'.format(client.name, e))
+						self._close(client)
+			now = time.monotonic()
+			if now - modem_lines_time >= MODEM_LINES_PERIOD:
+				modem_lines_time = now
+				self._check_modem_lines()
+		logging.info('bridge thread exits')
+
+	def _accept(self):
+		try:
+			sock, address = self._server.accept()
+		except BlockingIOError:
+			return
+		sock.setblocking(False)
+		sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		client = BridgeClient(sock, address, self.client_limit)
+		self._clients = self._clients + (client,)
+		self._selector.register(sock, selectors.EVENT_READ, client)
+		if self.protocol == 'rfc2217':
+			# rfc2217 is imported with the first client: it is not needed for raw bridge
+			from serial import rfc2217
+			# manager sends Telnet option requests at once
+			client.manager = rfc2217.PortManager(PortProxy(self.bus), client)
+			self._update(client)
+		logging.info('Bridge client {} is connected'.format(client.name))
+
+	def _close(self, client: BridgeClient):
+		if client in self._clients:
+			self._clients = tuple(c for c in self._clients if c is not client)
+			try:
+				self._selector.unregister(client.sock)
+			except (KeyError, ValueError):
+				pass
+			stats = client.queue.stats
+			logging.info('Bridge client {} is disconnected; dropped {} of {} bytes'.format(client.name,
+				stats.dropped_bytes, stats.put_bytes))
+		client.sock.close()
+
+	def _on_wake(self):
+		try:
+			while self._wake_r.recv(4096):
+				pass
+		except BlockingIOError:
+			pass
+		# reset after the drain: chunks queued later send a new wake-up
+		self._wake_pending = False
+		for client in self._clients:
+			self._update(client)
+
+	def _update(self, client: BridgeClient):
+		'Selects client for write while it has queued data'
+		events = selectors.EVENT_READ
+		if client.view is not None or not client.queue.empty():
+			events |= selectors.EVENT_WRITE
+		if self._selector.get_key(client.sock).events != events:
+			self._selector.modify(client.sock, events, client)
+
+	def _on_readable(self, client: BridgeClient):
+		try:
+			data = client.sock.recv(RECV_SIZE)
+		except BlockingIOError:
+			return
+		if not data:
+			raise ConnectionResetError('connection is closed by peer')
+		if client.manager:
+			try:
+				data = b''.join(client.manager.filter(data))
+			except (OSError, ValueError) as e:
+				# port settings of closed port or not supported by the port
+				logging.warning('Bridge client {}: {}'.format(client.name, e))
+				data = b''
+			# replies of the manager are queued
+			self._update(client)
+		if data:
+			self.bus.write(data)
+
+	def _on_writable(self, client: BridgeClient):
+		'Sends queued chunks till the socket buffer is full; chunks are sent by views, not copied'
+		while True:
+			if client.view is None:
+				if client.queue.empty():
+					break
+				client.view = memoryview(client.queue.get_nowait())
+			try:
+				sent = client.sock.send(client.view)
+			except BlockingIOError:
+				break
+			if sent < len(client.view):
+				client.view = client.view[sent:]
+				break
+			client.view = None
+		self._update(client)
+
+	def _check_modem_lines(self):
+		if not self.bus.is_open:
+			return
+		for client in self._clients:
+			if client.manager:
+				try:
+					client.manager.check_modem_lines()
+				except (OSError, ValueError) as e:
+					# port is closed by the bus
+					logging.debug(e)
+				self._update(client)
@@ -0,0 +1,152 @@
+from typing import Any, Callable, List, NamedTuple, Optional
+
+import time
+import queue
+import threading
+import collections
+
+
+# overflow policies
+BLOCK = 'block' # put waits for space up to block timeout, then the item is dropped
+DROP_OLDEST = 'drop-oldest'
+DROP_NEWEST = 'drop-newest'
+SPILL = 'spill' # the oldest items are passed to the spill callback (capture file) instead of kept in memory
+POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST, SPILL)
+
+BLOCK_TIMEOUT = 1.0 # s
+
+
+class QueueStats(NamedTuple):
+	queued_bytes: int
+	queued_items: int
+	high_water: int # max queued bytes
+	put_bytes: int
+	dropped_bytes: int
+	dropped_items: int
+	spilled_bytes: int
+
+	def __str__(self) -> str:
+		return '{} ({} max) queued, {} dropped{}'.format(format_size(self.queued_bytes),
+			format_size(self.high_water), format_size(self.dropped_bytes),
+			', {} spilled'.format(format_size(self.spilled_bytes)) if self.spilled_bytes else '')
+
+
+def format_size(size: int) -> str:
+	for unit in ('B', 'KiB', 'MiB'):
+		if size < 1024:
+			return '{:.0f} {}'.format(size, unit) if unit == 'B' else '{:.1f} {}'.format(size, unit)
+		size /= 1024
+	return '{:.1f} GiB'.format(size)
+
+
+class ByteQueue(object):
+	'''Thread safe FIFO bounded by bytes of the items, not by count; queue.Queue like get().
+	Single item over the limit is accepted into empty queue.'''
+
+	def __init__(self, limit: int=0, policy: str=DROP_OLDEST, size: Callable[[Any], int]=len,
+			spill: Optional[Callable[[Any], None]]=None, block_timeout: float=BLOCK_TIMEOUT):
+		if policy not in POLICIES:
+			raise ValueError('Wrong queue policy: ' + policy)
+		if policy == SPILL and not spill:
+			raise ValueError('Spill policy without spill')
+		self.limit = limit # bytes; 0 - unbounded
+		self.policy = policy
+		self.block_timeout = block_timeout
+		self._size = size
+		self._spill = spill
+		self._items: 'collections.deque[Any]' = collections.deque()
+		self._lock = threading.Lock()
+		self._not_empty = threading.Condition(self._lock)
+		self._not_full = threading.Condition(self._lock)
+		self._bytes = 0
+		self._high_water = 0
+		self._put_bytes = 0
+		self._dropped_bytes = 0
+		self._dropped_items = 0
+		self._spilled_bytes = 0
+
+	@property
+	def stats(self) -> QueueStats:
+		with self._lock:
+			return QueueStats(self._bytes, len(self._items), self._high_water, self._put_bytes,
+				self._dropped_bytes, self._dropped_items, self._spilled_bytes)
+
+	def qsize(self) -> int:
+		return len(self._items)
+
+	def empty(self) -> bool:
+		return not self._items
+
+	def put(self, item) -> bool:
+		'Queues item by the policy; returns False if item is dropped'
+		size = self._size(item)
+		evicted: List[Any] = []
+		with self._lock:
+			self._put_bytes += size
+			if self.limit and self._items and self._bytes + size > self.limit:
+				if self.policy == BLOCK:
+					deadline = time.monotonic() + self.block_timeout
+					while self._items and self._bytes + size > self.limit:
+						left = deadline - time.monotonic()
+						if left <= 0:
+							self._drop(size)
+							return False
+						self._not_full.wait(left)
+				elif self.policy == DROP_NEWEST:
+					self._drop(size)
+					return False
+				else:
+					while self._items and self._bytes + size > self.limit:
+						old = self._items.popleft()
+						old_size = self._size(old)
+						self._bytes -= old_size
+						if self.policy == SPILL:
+							self._spilled_bytes += old_size
+							evicted.append(old)
+						else:
+							self._drop(old_size)
+			self._items.append(item)
+			self._bytes += size
+			if self._bytes > self._high_water:
+				self._high_water = self._bytes
+			self._not_empty.notify()
+		# slow file write is out of the lock
+		for old in evicted:
+			self._spill(old)
+		return True
+
+	def _drop(self, size: int):
+		self._dropped_bytes += size
+		self._dropped_items += 1
+
+	def get(self, block=True, timeout: Optional[float]=None):
+		'Gets the oldest item; raises queue.Empty'
+		with self._not_empty:
+			if block:
+				deadline = None if timeout is None else time.monotonic() + timeout
+				while not self._items:
+					left = None if deadline is None else deadline - time.monotonic()
+					if left is not None and left <= 0:
+						raise queue.Empty
+					self._not_empty.wait(left)
+			elif not self._items:
+				raise queue.Empty
+			item = self._items.popleft()
+			self._bytes -= self._size(item)
+			self._not_full.notify()
+			return item
+
+	def get_nowait(self):
+		return self.get(False)
+
+	def get_all(self) -> List[Any]:
+		'Drains all items without blocking'
+		with self._lock:
+			ret = list(self._items)
+			self._items.clear()
+			self._bytes = 0
+			self._not_full.notify_all()
+			return ret
+
+	def clear(self):
+		self.get_all()
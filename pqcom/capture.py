@@ -0,0 +1,236 @@
+'''Append-only binary capture of port traffic.
+
+Capture file: header, then records: header (monotonic timestamp ns, direction, port id, length) and raw bytes.
+Port names are stored as PORT records: port id -> UTF-8 name.
+Sparse time index is stored in the <capture>.idx file: (timestamp ns, record offset) each INDEX_STRIDE bytes;
+PORT records are indexed by INDEX_PORT timestamp.
+
+Records are in the order of writing, not strictly of time: I/O threads stamp chunks as they are read, before
+the writer lock, so neighbouring records of the ports and directions may be out of order by the lock wait.
+Time range reads tolerate disorder up to ORDER_TOLERANCE_NS.
+'''
+
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+import os
+import sys
+import mmap
+import bisect
+import struct
+import threading
+import time
+import argparse
+
+from pqcom import serial_bus
+
+
+MAGIC = b'PQCOMCAP'
+VERSION = 1
+
+# magic, version, reserved, wall clock ns & monotonic ns at the capture start
+FILE_HEADER = struct.Struct('<8sII qq')
+# timestamp ns, direction, reserved, port id, data length
+RECORD_HEADER = struct.Struct('<qBBHI')
+# timestamp ns, record offset
+INDEX_ENTRY = struct.Struct('<qQ')
+INDEX_PORT = -1
+
+RX = serial_bus.RX
+TX = serial_bus.TX
+PORT = 0xFF # payload is UTF-8 port name
+
+INDEX_STRIDE = 64 * 1024
+ORDER_TOLERANCE_NS = 1000000000 # max disorder of record timestamps
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+INDEX_SUFFIX = '.idx'
+
+
+class CaptureRecord(NamedTuple):
+	timestamp_ns: int
+	direction: int
+	port_id: int
+	data: memoryview
+
+
+class CaptureWriter(object):
+	'Appends records to capture file; thread safe'
+
+	def __init__(self, path: str):
+		self.path = path
+		self._lock = threading.Lock()
+		self._ports: Dict[str, int] = {}
+		is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+		self._file = open(path, 'ab', buffering=WRITE_BUFFER_SIZE)
+		self._index = open(path + INDEX_SUFFIX, 'ab')
+		# monotonic clock of the capture start: appended session timestamps are moved to it
+		self._clock_delta = 0
+		if is_new:
+			self._file.write(FILE_HEADER.pack(MAGIC, VERSION, 0, time.time_ns(), time.monotonic_ns()))
+			self._file.flush()
+		else:
+			# appending: port ids are continued
+			with CaptureReader(path) as reader:
+				self._ports = {name: port_id for port_id, name in reader.ports.items()}
+				self._clock_delta = (time.time_ns() - time.monotonic_ns()) - (reader.wall_ns - reader.monotonic_ns)
+		self._offset = self._file.tell()
+		self._next_index_offset = self._offset
+
+	def _port_id(self, port: str) -> int:
+		'Gets id of port name; new id is recorded as PORT record'
+		port_id = self._ports.get(port)
+		if port_id is None:
+			port_id = len(self._ports)
+			self._ports[port] = port_id
+			self._index.write(INDEX_ENTRY.pack(INDEX_PORT, self._offset))
+			self._append(time.monotonic_ns(), PORT, port_id, port.encode())
+		return port_id
+
+	def write(self, direction: int, port: str, data, timestamp_ns: Optional[int]=None):
+		if timestamp_ns is None:
+			timestamp_ns = time.monotonic_ns()
+		with self._lock:
+			self._append(timestamp_ns, direction, self._port_id(port), data)
+
+	def on_chunk(self, bus: serial_bus.SerialBus, direction: int, timestamp_ns: int, data):
+		'SerialBus listener'
+		self.write(direction, bus.port, data, timestamp_ns)
+
+	def _append(self, timestamp_ns: int, direction: int, port_id: int, data):
+		timestamp_ns += self._clock_delta
+		if self._offset >= self._next_index_offset:
+			self._index.write(INDEX_ENTRY.pack(timestamp_ns, self._offset))
+			self._next_index_offset = self._offset + INDEX_STRIDE
+		self._file.write(RECORD_HEADER.pack(timestamp_ns, direction, 0, port_id, len(data)))
+		self._file.write(data)
+		self._offset += RECORD_HEADER.size + len(data)
+
+	def flush(self):
+		with self._lock:
+			self._file.flush()
+			self._index.flush()
+
+	def close(self):
+		with self._lock:
+			self._file.close()
+			self._index.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+
+class CaptureReader(object):
+	'Reads capture file by mmap; seeks time by the sparse index'
+
+	def __init__(self, path: str):
+		self.path = path
+		with open(path, 'rb') as f:
+			if os.fstat(f.fileno()).st_size < FILE_HEADER.size:
+				raise IOError('Wrong capture file: ' + path)
+			self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		magic, version, _, self.wall_ns, self.monotonic_ns = FILE_HEADER.unpack_from(self._map, 0)
+		if magic != MAGIC or version != VERSION:
+			self._map.close()
+			raise IOError('Wrong capture file: ' + path)
+		# sparse index is small: an entry per INDEX_STRIDE bytes
+		self._index_timestamps: List[int] = []
+		self._index_offsets: List[int] = []
+		self.ports: Dict[int, str] = {}
+		try:
+			with open(path + INDEX_SUFFIX, 'rb') as f:
+				index = f.read()
+		except IOError:
+			index = b''
+		size = len(self._map)
+		for timestamp_ns, offset in INDEX_ENTRY.iter_unpack(index[:len(index) - len(index) % INDEX_ENTRY.size]):
+			if offset >= size:
+				# index may be ahead of the flushed capture
+				break
+			if timestamp_ns == INDEX_PORT:
+				for record in self._records(offset, with_ports=True):
+					self.ports[record.port_id] = bytes(record.data).decode()
+					break
+			else:
+				self._index_timestamps.append(timestamp_ns)
+				self._index_offsets.append(offset)
+
+	def close(self):
+		try:
+			self._map.close()
+		except BufferError:
+			# record views are still alive: mapping is released with the last of them
+			pass
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def to_wall_ns(self, timestamp_ns: int) -> int:
+		'Converts record timestamp to wall clock time, ns since epoch'
+		return self.wall_ns + timestamp_ns - self.monotonic_ns
+
+	def seek(self, timestamp_ns: int) -> int:
+		'''Gets offset of the record to start the scan for timestamp from: records of the timestamp are not before it
+		even out of order by ORDER_TOLERANCE_NS'''
+		i = bisect.bisect_right(self._index_timestamps, timestamp_ns - ORDER_TOLERANCE_NS)
+		return self._index_offsets[i - 1] if i else FILE_HEADER.size
+
+	def _records(self, offset: int, with_ports=False) -> Iterator[CaptureRecord]:
+		size = len(self._map)
+		view = memoryview(self._map)
+		try:
+			while offset + RECORD_HEADER.size <= size:
+				timestamp_ns, direction, _, port_id, length = RECORD_HEADER.unpack_from(self._map, offset)
+				offset += RECORD_HEADER.size
+				if offset + length > size:
+					# incomplete last record
+					break
+				if with_ports or direction != PORT:
+					yield CaptureRecord(timestamp_ns, direction, port_id, view[offset:offset + length])
+				offset += length
+		finally:
+			view.release()
+
+	def records(self, start_ns: Optional[int]=None, end_ns: Optional[int]=None) -> Iterator[CaptureRecord]:
+		'Iterates data records in the time range in the file order; data are views of the mapped file'
+		offset = FILE_HEADER.size if start_ns is None else self.seek(start_ns)
+		for record in self._records(offset):
+			if start_ns is not None and record.timestamp_ns < start_ns:
+				continue
+			if end_ns is not None and record.timestamp_ns >= end_ns:
+				if record.timestamp_ns >= end_ns + ORDER_TOLERANCE_NS:
+					# the following records are out of the range even out of order
+					break
+				continue
+			yield record
+
+	def __iter__(self) -> Iterator[CaptureRecord]:
+		return self.records()
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Dump pqcom capture file')
+	parser.add_argument('path', metavar='FILE', help='capture file')
+	parser.add_argument('--from', dest='start', metavar='SEC', type=float,
+		help='start time from the capture start, s')
+	parser.add_argument('--to', dest='end', metavar='SEC', type=float,
+		help='end time from the capture start, s')
+	parser.add_argument('-x', action='store_true', help='HEX data')
+	args = parser.parse_args()
+
+	with CaptureReader(args.path) as reader:
+		start_ns = None if args.start is None else reader.monotonic_ns + int(args.start * 1e9)
+		end_ns = None if args.end is None else reader.monotonic_ns + int(args.end * 1e9)
+		for record in reader.records(start_ns, end_ns):
+			data = bytes(record.data)
+			print('{:.6f} {} {} {:02} {}'.format((record.timestamp_ns - reader.monotonic_ns) / 1e9,
+				reader.ports.get(record.port_id, record.port_id), '<<' if record.direction == RX else '>>',
+				len(data), data.hex(' ') if args.x else repr(data)[2:-1]))
+
+if __name__ == '__main__':
+	sys.exit(main())
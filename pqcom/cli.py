@@ -0,0 +1,194 @@
+import sys
+import logging
+import argparse
+
+from pqcom import framing
+from pqcom import byte_queue
+from pqcom import io_stats
+from pqcom import profiling
+from pqcom import bridge
+from pqcom import serial_bus
+from pqcom import pqcom_translator as translator
+
+
+DEFAULT_COM_BAUDRATE = 115200
+DEFAULT_COM_PARAMETERS = '8N1'
+DEFAULT_MAX_LINES = 100000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+IO_BACKENDS = ('threads', 'selector')
+DEFAULT_IO_BACKEND = 'threads'
+
+HEADLESS_FORMATS = ('raw', 'hex', 'lines')
+DEFAULT_HEADLESS_FORMAT = 'lines'
+
+
+def framing_spec(spec: str) -> str:
+	'Checks --framing spec'
+	try:
+		framing.create_framer(spec)
+	except ValueError as e:
+		raise argparse.ArgumentTypeError(str(e))
+	return spec
+
+def encoding_name(encoding: str) -> str:
+	'Checks --encoding name'
+	try:
+		translator.check_encoding(encoding)
+	except LookupError as e:
+		raise argparse.ArgumentTypeError(str(e))
+	return encoding
+
+def bridge_address(address: str) -> str:
+	'Checks --bridge address'
+	try:
+		bridge.parse_address(address)
+	except ValueError:
+		raise argparse.ArgumentTypeError('Wrong bridge address: {}; expected [HOST:]PORT'.format(address))
+	return address
+
+def parse_args(argv=None) -> argparse.Namespace:
+	parser = argparse.ArgumentParser(description='Simple serial port dump', formatter_class=argparse.RawTextHelpFormatter)
+	parser.add_argument('-p', '--port', metavar='COM_PORT', help='serial port')
+	parser.add_argument('-b', '--baudrate', metavar='BAUDRATE', default=DEFAULT_COM_BAUDRATE, type=int,
+		help='serial port baudrate; default: '+str(DEFAULT_COM_BAUDRATE))
+	parser.add_argument('--port-parameters', metavar='PARAMETERS', default=DEFAULT_COM_PARAMETERS,
+		help='serial port parameters; default: '+str(DEFAULT_COM_PARAMETERS))
+	# parser.add_argument('-v', action='count', default=0, help='verbose level: -v, -vv or -vvv (bytes); default: -v')
+	parser.add_argument('--read-size', metavar='BYTES', type=int,
+		help='RX chunk size; default: about 10 ms of data at baudrate')
+	parser.add_argument('--inter-byte-timeout', metavar='SEC', type=float,
+		help='RX idle gap which ends a chunk; default: about 4 chars at baudrate')
+	parser.add_argument('--io', choices=IO_BACKENDS, default=DEFAULT_IO_BACKEND,
+		help='ports I/O: RX/TX thread pair per port or one selector thread for all ports (POSIX); default: '+DEFAULT_IO_BACKEND)
+	parser.add_argument('--framing', metavar='SPEC', type=framing_spec,
+		help='show RX frames instead of chunks: delimiter[:HEX], length[:SIZE[:ORDER[:OFFSET[:ADJUST]]]],\n'
+			'slip, cobs, fixed:SIZE or idle:SEC; see pqcom/framing.py')
+	parser.add_argument('--rx-queue-limit', metavar='BYTES', type=int, default=serial_bus.RX_QUEUE_LIMIT,
+		help='RX queue limit, 0 - unbounded; default: '+str(serial_bus.RX_QUEUE_LIMIT))
+	parser.add_argument('--rx-queue-policy', choices=byte_queue.POLICIES, default=byte_queue.DROP_OLDEST,
+		help='full RX queue: block RX thread (for up to {} s; --io threads only), drop oldest/newest chunks or spill oldest to --spill file;\n'
+			'default: {}'.format(byte_queue.BLOCK_TIMEOUT, byte_queue.DROP_OLDEST))
+	parser.add_argument('--tx-queue-limit', metavar='BYTES', type=int, default=serial_bus.TX_QUEUE_LIMIT,
+		help='TX queue limit, 0 - unbounded; default: '+str(serial_bus.TX_QUEUE_LIMIT))
+	parser.add_argument('--tx-queue-policy', choices=byte_queue.POLICIES[:3], default=byte_queue.BLOCK,
+		help='full TX queue: block sender (for up to {} s), drop oldest/newest data; default: {}'.format(
+			byte_queue.BLOCK_TIMEOUT, byte_queue.BLOCK))
+	parser.add_argument('--spill', metavar='FILE',
+		help='capture file of RX chunks evicted from full RX queue by spill policy')
+	parser.add_argument('--stats-file', metavar='FILE',
+		help='write I/O statistics of the ports each --stats-period: rates, queues, read sizes, reconnects, drain lag')
+	parser.add_argument('--stats-format', choices=io_stats.EXPORT_FORMATS, default=io_stats.EXPORT_FORMATS[0],
+		help='statistics file: appended JSON lines or replaced Prometheus text file; default: '+io_stats.EXPORT_FORMATS[0])
+	parser.add_argument('--stats-period', metavar='SEC', type=float, default=io_stats.STATS_PERIOD,
+		help='statistics sampling period, also of the status bar; default: '+str(io_stats.STATS_PERIOD))
+	parser.add_argument('--bridge', metavar='[HOST:]PORT', type=bridge_address,
+		help='share the port with TCP clients: RX to all clients, client data to TX; host default: '
+			+bridge.DEFAULT_HOST+'\n(0.0.0.0 - all interfaces); see pqcom/bridge.py')
+	parser.add_argument('--bridge-protocol', choices=bridge.PROTOCOLS, default=bridge.PROTOCOLS[0],
+		help='bridge protocol: plain bytes or Telnet RFC 2217; default: '+bridge.PROTOCOLS[0])
+	parser.add_argument('--bridge-buffer', metavar='BYTES', type=int, default=bridge.CLIENT_BUFFER_LIMIT,
+		help='RX bytes queued per bridge client, the oldest are dropped for slow client; default: '
+			+str(bridge.CLIENT_BUFFER_LIMIT))
+	parser.add_argument('-r', action='store_true', help='reconnect to serial port')
+	parser.add_argument('-s', action='store_true', help='start and hide setup dialog')
+	parser.add_argument('-x', action='store_true', help='switch to HEX view')
+	parser.add_argument('--encoding', metavar='NAME', type=encoding_name, default=translator.BYTES_ENCODING,
+		help='RX text encoding, e.g. utf-8; multi-byte characters may span chunks;\n'
+			'default: {} - ASCII with \\xNN escapes'.format(translator.BYTES_ENCODING))
+	parser.add_argument('--timestamps', choices=translator.TIMESTAMP_FORMATS, default=translator.TIME_TIMESTAMPS,
+		help='RX timestamps: local time, seconds since the first chunk or none; default: '+translator.TIME_TIMESTAMPS)
+	# parser.add_argument('--bytes', action='store_true', help='receive byte by byte')
+	# parser.add_argument('--reconnect-delay', metavar='SEC', type=float, default=DEFAULT_COM_RECONNECT_DELAY,
+	# 	help='reconnect delay, s; default: '+str(DEFAULT_COM_RECONNECT_DELAY))
+	parser.add_argument('--max-lines', metavar='LINES', default=DEFAULT_MAX_LINES, type=int,
+		help='receive view keeps up to the lines; default: '+str(DEFAULT_MAX_LINES))
+	parser.add_argument('--max-bytes', metavar='BYTES', default=DEFAULT_MAX_BYTES, type=int,
+		help='receive view keeps up to the bytes of data, the oldest lines are dropped; default: '+str(DEFAULT_MAX_BYTES))
+	parser.add_argument('--vid-pid', metavar='VID:PID',
+		help='search for USB: VendorID:ProductID[,VendorID:ProductID[...]]; example: 03eb:2404,03eb:6124')
+	parser.add_argument('--capture', metavar='FILE',
+		help='append RX/TX chunks of all ports to binary capture file; dump: python -m pqcom.capture FILE')
+	parser.add_argument('--headless', action='store_true',
+		help='no GUI: dump received data to stdout or --output file')
+	parser.add_argument('-o', '--output', metavar='FILE',
+		help='headless output file (appended); default: stdout')
+	parser.add_argument('--format', choices=HEADLESS_FORMATS, default=DEFAULT_HEADLESS_FORMAT,
+		help='headless output format: raw bytes, hex dump or timestamped lines; default: '+DEFAULT_HEADLESS_FORMAT)
+	parser.add_argument('--script', metavar='FILE',
+		help='headless: run send/expect script on the opened port and exit with its result; see pqcom/sequence.py')
+	parser.add_argument('--profile', metavar='PREFIX',
+		help='profile till exit: write cProfile stats PREFIX.prof, tracemalloc snapshot PREFIX.tracemalloc\n'
+			'and RX/TX span trace PREFIX.trace.json; see pqcom/profiling.py')
+	parser.add_argument('--trace', metavar='FILE',
+		help='record RX/TX hot path spans till exit and write them as Chrome trace JSON (chrome://tracing)')
+	# parser.add_argument('--trace-error', action='store_true', help='show the errors trace; default: off')
+	args = parser.parse_args(argv)
+	if args.rx_queue_policy == byte_queue.SPILL and not args.spill:
+		parser.error('spill policy requires --spill FILE')
+	if args.rx_queue_policy == byte_queue.BLOCK and args.io == 'selector':
+		# blocked put would stall RX & TX of all ports of the shared selector thread
+		parser.error('block RX queue policy requires --io threads')
+	if args.stats_period <= 0:
+		parser.error('--stats-period must be positive')
+	return args
+
+def configure_logging(args):
+	'Logs to stderr: INFO of headless & profiled runs (opened port, totals on exit), warnings of GUI'
+	logging.basicConfig(level=logging.INFO if args.headless or args.profile else logging.WARNING,
+		format='%(asctime)s %(levelname)s %(message)s')
+
+def main():
+	'pqcom entry point: PyQt5 is imported only for GUI mode'
+	args = parse_args()
+	configure_logging(args)
+	if args.headless:
+		from pqcom import headless
+		with profiling.session(args.profile, args.trace):
+			return headless.main(args)
+	from pqcom import main as gui
+	return gui.main(args)
+
+def create_io_engine(args):
+	'Gets shared I/O engine for SerialBus ports or None for thread pair per port'
+	if args.io == 'selector':
+		from pqcom.serial_selector import SelectorEngine
+		if SelectorEngine.is_supported():
+			return SelectorEngine()
+		logging.warning('Selector I/O is not supported on the platform; threads are used')
+	return None
+
+def create_capture(args):
+	'Gets capture writer for SerialBus listeners or None'
+	if args.capture:
+		from pqcom.capture import CaptureWriter
+		return CaptureWriter(args.capture)
+	return None
+
+def create_spill(args):
+	'Gets capture writer of RX chunks spilled from full queues or None'
+	if args.rx_queue_policy == byte_queue.SPILL:
+		from pqcom.capture import CaptureWriter
+		return CaptureWriter(args.spill)
+	return None
+
+def create_stats_exporter(args):
+	'Gets I/O statistics file writer or None'
+	if args.stats_file:
+		return io_stats.StatsExporter(args.stats_file, args.stats_format)
+	return None
+
+def create_bridge(bus: serial_bus.SerialBus, args):
+	'Gets started bridge server of the bus or None; raises OSError if address is not available'
+	if not args.bridge:
+		return None
+	host, port = bridge.parse_address(args.bridge)
+	server = bridge.BridgeServer(bus, host, port, args.bridge_protocol, args.bridge_buffer)
+	server.start()
+	return server
+
+def configure_queues(bus: serial_bus.SerialBus, args, spill=None):
+	bus.set_queue_limits(args.rx_queue_limit, args.rx_queue_policy, args.tx_queue_limit, args.tx_queue_policy, spill)
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,270 @@
+'''Streaming frame decoders between SerialBus RX chunks and the display.
+
+Framer.feed() takes RX chunks (timestamp ns, data) and gets whole frames (timestamp ns of the chunk with
+the frame first byte, frame bytes). Incomplete frame is kept in the bytearray accumulator till the next chunk;
+frames are sliced by memoryview, so data are copied to the accumulator (the incomplete frame only)
+and to the frame once.
+
+Framing spec of create_framer():
+	delimiter[:HEX]                    frames end by the delimiter; default: 0a
+	length[:SIZE[:ORDER[:OFFSET[:ADJUST]]]]
+	                                   frame is header of OFFSET bytes & SIZE bytes length field, then
+	                                   length + ADJUST bytes; defaults: 2, big, 0, 0
+	slip                               RFC 1055 SLIP
+	cobs                               Consistent Overhead Byte Stuffing, 00 delimited
+	fixed:SIZE                         frames of SIZE bytes
+	idle:SEC                           frame ends by RX idle gap of SEC
+'''
+
+from typing import List, Optional, Tuple
+
+import logging
+
+
+MAX_FRAME_SIZE = 64 * 1024 # longer frame is cut: lost delimiter does not grow the accumulator
+
+FRAMINGS = ('delimiter', 'length', 'slip', 'cobs', 'fixed', 'idle')
+
+FRAME = Tuple[int, bytes] # timestamp ns, frame
+
+
+class Framer(object):
+	'Streaming frame decoder: state is kept between chunks'
+
+	def __init__(self, max_size: int=MAX_FRAME_SIZE):
+		self.max_size = max_size
+		self.errors = 0 # count of malformed frames
+		self._buffer = bytearray() # incomplete frame
+		self._timestamp_ns = 0 # of the incomplete frame first byte
+
+	@property
+	def pending(self) -> int:
+		'Bytes of incomplete frame'
+		return len(self._buffer)
+
+	def feed(self, timestamp_ns: int, data) -> List[FRAME]:
+		'Gets frames completed by the chunk: bytes, bytearray or other bytes-like data'
+		if not isinstance(data, (bytes, bytearray)):
+			# decoders search the view object: memoryview slice is searched as the whole buffer
+			data = bytes(data)
+		if self._buffer:
+			self._buffer += data
+			source = self._buffer
+		else:
+			# chunk is decoded in place: only the incomplete frame is copied to the accumulator
+			source = data
+			self._timestamp_ns = timestamp_ns
+		with memoryview(source) as view:
+			frames, consumed = self._decode(view)
+			if source is not self._buffer and consumed < len(view):
+				self._buffer = bytearray(view[consumed:])
+		if source is self._buffer:
+			# the view is released: accumulator can be resized
+			del self._buffer[:consumed]
+		if not frames:
+			return []
+		ret = [(self._timestamp_ns, frames[0])]
+		ret.extend((timestamp_ns, frame) for frame in frames[1:])
+		self._timestamp_ns = timestamp_ns
+		return ret
+
+	def poll(self, now_ns: int) -> List[FRAME]:
+		'Gets frames completed by time'
+		return []
+
+	def flush(self) -> List[FRAME]:
+		'Gets incomplete frame'
+		if not self._buffer:
+			return []
+		frame = bytes(self._buffer)
+		self._buffer.clear()
+		return [(self._timestamp_ns, frame)]
+
+	def reset(self):
+		self._buffer.clear()
+
+	def _decode(self, view: memoryview) -> Tuple[List[bytes], int]:
+		'Gets frames of the view start & count of consumed bytes'
+		raise NotImplementedError
+
+
+class DelimiterFramer(Framer):
+	'Frames end by the delimiter; delimiter is kept'
+
+	def __init__(self, delimiter: bytes=b'\n', max_size: int=MAX_FRAME_SIZE):
+		super(DelimiterFramer, self).__init__(max_size)
+		if not delimiter:
+			raise ValueError('Empty frame delimiter')
+		self.delimiter = delimiter
+
+	def _decode(self, view):
+		frames = []
+		data = view.obj
+		size = len(view)
+		start = 0
+		while start < size:
+			end = data.find(self.delimiter, start, start + self.max_size)
+			if end < 0:
+				if size - start < self.max_size:
+					break
+				end = start + self.max_size
+			else:
+				end += len(self.delimiter)
+			frames.append(bytes(view[start:end]))
+			start = end
+		return frames, start
+
+
+class LengthFramer(Framer):
+	'Length prefixed frames: header of offset bytes, length field, then length + adjust bytes'
+
+	def __init__(self, size: int=2, byteorder: str='big', offset: int=0, adjust: int=0,
+			max_size: int=MAX_FRAME_SIZE):
+		super(LengthFramer, self).__init__(max_size)
+		if size not in (1, 2, 4) or byteorder not in ('big', 'little'):
+			raise ValueError('Wrong length field: {} {}'.format(size, byteorder))
+		self.size = size
+		self.byteorder = byteorder
+		self.offset = offset
+		self.adjust = adjust
+
+	def _decode(self, view):
+		frames = []
+		header = self.offset + self.size
+		size = len(view)
+		start = 0
+		while size - start >= header:
+			length = int.from_bytes(view[start + self.offset:start + header], self.byteorder) + self.adjust
+			end = start + header + max(0, min(length, self.max_size))
+			if end > size:
+				break
+			frames.append(bytes(view[start:end]))
+			start = end
+		return frames, start
+
+
+class SlipFramer(Framer):
+	'RFC 1055 SLIP: END delimited, END & ESC are escaped'
+	END = b'\xc0'
+	ESC = b'\xdb'
+	ESC_END = b'\xdb\xdc'
+	ESC_ESC = b'\xdb\xdd'
+
+	def _decode(self, view):
+		frames = []
+		data = view.obj
+		size = len(view)
+		start = 0
+		while start < size:
+			end = data.find(self.END, start)
+			if end < 0:
+				if size - start > self.max_size:
+					self.errors += 1
+					start = size
+				break
+			if end > start:
+				frames.append(bytes(view[start:end]).replace(self.ESC_END, self.END).replace(self.ESC_ESC, self.ESC))
+			start = end + 1
+		return frames, start
+
+
+class CobsFramer(Framer):
+	'Consistent Overhead Byte Stuffing: 00 delimited'
+
+	@staticmethod
+	def decode(view: memoryview) -> Optional[bytes]:
+		'Gets decoded frame or None if malformed'
+		ret = bytearray()
+		size = len(view)
+		i = 0
+		while i < size:
+			code = view[i]
+			if code == 0 or i + code > size:
+				return None
+			ret += view[i + 1:i + code]
+			i += code
+			if code < 0xFF and i < size:
+				ret.append(0)
+		return bytes(ret)
+
+	def _decode(self, view):
+		frames = []
+		data = view.obj
+		size = len(view)
+		start = 0
+		while start < size:
+			end = data.find(b'\0', start)
+			if end < 0:
+				if size - start > self.max_size:
+					self.errors += 1
+					start = size
+				break
+			if end > start:
+				frame = self.decode(view[start:end])
+				if frame is None:
+					self.errors += 1
+				else:
+					frames.append(frame)
+			start = end + 1
+		return frames, start
+
+
+class FixedFramer(Framer):
+	'Frames of fixed size'
+
+	def __init__(self, size: int):
+		super(FixedFramer, self).__init__(size)
+		if size <= 0:
+			raise ValueError('Wrong frame size: {}'.format(size))
+		self.size = size
+
+	def _decode(self, view):
+		end = len(view) - len(view) % self.size
+		return [bytes(view[i:i + self.size]) for i in range(0, end, self.size)], end
+
+
+class IdleGapFramer(Framer):
+	'Frame ends by RX idle gap: chunk after the gap or poll() after the gap'
+
+	def __init__(self, gap: float, max_size: int=MAX_FRAME_SIZE):
+		super(IdleGapFramer, self).__init__(max_size)
+		self.gap_ns = int(gap * 1e9)
+		self._last_ns = 0 # timestamp of the last chunk
+
+	def feed(self, timestamp_ns, data):
+		ret = self.poll(timestamp_ns)
+		self._last_ns = timestamp_ns
+		return ret + super(IdleGapFramer, self).feed(timestamp_ns, data)
+
+	def poll(self, now_ns):
+		if self._buffer and now_ns - self._last_ns >= self.gap_ns:
+			return self.flush()
+		return []
+
+	def _decode(self, view):
+		# the frame is completed by time: only too long frame is cut here
+		end = len(view) - len(view) % self.max_size
+		return [bytes(view[i:i + self.max_size]) for i in range(0, end, self.max_size)], end
+
+
+def create_framer(spec: Optional[str]) -> Optional[Framer]:
+	'Gets framer by spec (see the module doc) or None for no framing; raises ValueError'
+	if not spec or spec == 'none':
+		return None
+	name, *params = spec.split(':')
+	try:
+		if name == 'delimiter':
+			return DelimiterFramer(bytes.fromhex(params[0]) if params else b'\n')
+		if name == 'length':
+			return LengthFramer(*[int(p) if i != 1 else p for i, p in enumerate(params)])
+		if name == 'slip' and not params:
+			return SlipFramer()
+		if name == 'cobs' and not params:
+			return CobsFramer()
+		if name == 'fixed' and len(params) == 1:
+			return FixedFramer(int(params[0]))
+		if name == 'idle' and len(params) == 1:
+			return IdleGapFramer(float(params[0]))
+	except (TypeError, IndexError) as e:
+		logging.debug(e)
+	raise ValueError('Wrong framing: {}; expected one of: {}'.format(spec, ', '.join(FRAMINGS)))
@@ -0,0 +1,175 @@
+import sys
+import time
+import logging
+import threading
+
+from pqcom import cli
+from pqcom import serial_bus
+from pqcom import sequence
+from pqcom import framing
+from pqcom import port_watcher
+from pqcom import pqcom_translator as translator
+from pqcom.tracer import tracer
+
+
+RECONNECT_PERIOD = 0.5 # s
+RECONNECT_FALLBACK_PERIOD = 2.0 # s; with port hotplug events
+FLUSH_PERIOD = 0.2 # s; output is flushed when port is idle
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+DROP_REPORT_PERIOD = 5.0 # s; dropped data are reported not more often
+
+
+def open_output(path=None):
+	'Opens headless output: appended file or stdout with large buffer'
+	if path:
+		return open(path, 'ab', buffering=OUTPUT_BUFFER_SIZE)
+	return open(sys.stdout.fileno(), 'wb', buffering=OUTPUT_BUFFER_SIZE, closefd=False)
+
+def get_formatter(form: str, is_hex=False, encoding: str=translator.BYTES_ENCODING,
+		timestamps: str=translator.TIME_TIMESTAMPS):
+	'Gets received chunk (timestamp_ns, data) -> bytes formatter for the headless output format'
+	if form == 'raw':
+		return lambda record: record[1]
+	if form == 'hex':
+		return lambda record: translator.to_hex_prefix_string(record[1]).encode('ascii')
+	render = translator.RxRenderer(encoding, is_hex, timestamps).render
+	return lambda record: (render(*record) + '\n').encode('utf-8')
+
+def main(args) -> int:
+	'Captures the port without GUI; returns exit code'
+	parameters = serial_bus.SerialParameters(read_size=args.read_size, inter_byte_timeout=args.inter_byte_timeout)
+	parameters.set('{} {}'.format(args.baudrate, args.port_parameters))
+	vid_pid = serial_bus.SerialParameters.get_vidpid_list(args.vid_pid)
+	if not args.port and not vid_pid:
+		logging.error('Serial port or VID:PID is not specified')
+		return 2
+	steps = None
+	if args.script:
+		try:
+			steps = sequence.load_script(args.script)
+		except (IOError, sequence.SequenceError) as e:
+			logging.error('Script {}: {}'.format(args.script, e))
+			return 2
+
+	received = threading.Event()
+	failed = threading.Event()
+	ports_changed = threading.Event()
+	on_ports = lambda ports: ports_changed.set()
+	# port changes are watched for reconnect only
+	watcher = port_watcher.get_watcher() if args.r else None
+	if watcher:
+		watcher.add_listener(on_ports)
+
+	def on_failed():
+		failed.set()
+		received.set()
+
+	engine = cli.create_io_engine(args)
+	bus = serial_bus.SerialBus(received.set, on_failed, engine)
+	try:
+		server = cli.create_bridge(bus, args)
+	except OSError as e:
+		logging.error('Bridge {}: {}'.format(args.bridge, e))
+		return 2
+	capture = cli.create_capture(args)
+	if capture:
+		bus.add_listener(capture.on_chunk)
+	spill = cli.create_spill(args)
+	cli.configure_queues(bus, args, spill)
+	dropped = 0
+	dropped_report = time.monotonic()
+	sampler = bus.create_sampler()
+	exporter = cli.create_stats_exporter(args)
+	sampled = time.monotonic()
+
+	def sample_stats():
+		nonlocal sampled
+		now = time.monotonic()
+		if exporter and now - sampled >= args.stats_period:
+			sampled = now
+			exporter.write([sampler.sample()])
+	result = []
+
+	def on_script_finished(ok, message):
+		logging.info('Script {}: {}'.format(args.script, message))
+		result.append(ok)
+		received.set()
+
+	runner = sequence.SequenceRunner(bus, on_script_finished)
+	framer = framing.create_framer(args.framing)
+	format_chunk = get_formatter(args.format, args.x, args.encoding, args.timestamps)
+	output = open_output(args.output)
+	ret = 0
+	try:
+		while not result:
+			failed.clear()
+			bus.start(parameters, port_name=args.port, vid_pid=vid_pid)
+			if bus.is_open:
+				logging.info('Opened port: ' + bus.port_and_properties)
+				if steps and not runner.is_running:
+					runner.start(steps)
+				while True:
+					sample_stats()
+					if not received.wait(FLUSH_PERIOD):
+						if framer:
+							output.write(b''.join(map(format_chunk, framer.poll(time.monotonic_ns()))))
+						output.flush()
+						if capture:
+							capture.flush()
+						continue
+					received.clear()
+					chunks = bus.read_all()
+					if framer:
+						chunks = [frame for timestamp_ns, data in chunks for frame in framer.feed(timestamp_ns, data)]
+					if chunks:
+						start = tracer.begin()
+						output.write(b''.join(map(format_chunk, chunks)))
+						tracer.end('output.write', start)
+					if failed.is_set() or result:
+						break
+					now = time.monotonic()
+					if now - dropped_report >= DROP_REPORT_PERIOD:
+						dropped_report = now
+						total = sum(stats.dropped_bytes for stats in bus.queue_stats())
+						if total != dropped:
+							dropped = total
+							logging.warning('Queues overflow: RX {}; TX {}'.format(*bus.queue_stats()))
+				output.flush()
+				if result:
+					break
+				logging.warning('Port failed: ' + bus.port)
+				bus.join()
+			if not args.r:
+				ret = 1
+				break
+			sample_stats()
+			# reconnect at once on hotplug; the period is a fallback
+			ports_changed.wait(RECONNECT_PERIOD if not watcher.is_event_driven else RECONNECT_FALLBACK_PERIOD)
+			ports_changed.clear()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		if watcher:
+			watcher.remove_listener(on_ports)
+		runner.stop()
+		if server:
+			server.stop()
+		bus.join()
+		if engine:
+			engine.stop()
+		if capture:
+			capture.close()
+		if spill:
+			spill.close()
+		stats = sampler.sample()
+		logging.info('Queues: RX {}; TX {}'.format(stats.rx_queue, stats.tx_queue))
+		logging.info('I/O: received {} bytes in {} chunks, sent {} bytes, reconnects {}, errors {}'.format(
+			stats.rx_bytes, stats.rx_chunks, stats.tx_bytes, stats.reconnects, stats.errors))
+		if exporter:
+			exporter.write([stats])
+		if framer:
+			output.write(b''.join(map(format_chunk, framer.flush())))
+		output.close()
+	if result:
+		ret = 0 if result[0] else 1
+	return ret
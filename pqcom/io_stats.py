@@ -0,0 +1,196 @@
+'''SerialBus I/O statistics: counters of the I/O threads, per-second samples & export for monitoring.
+
+Counters are plain ints updated by the threads without locks: each counter has one writer thread,
+StatsSampler only reads them (except the per-interval maximum of drain lag, reset by the reading thread).
+
+Export formats:
+	jsonl                              JSON object per port & period appended to the file
+	prometheus                         text exposition format; the file is replaced each period
+	                                   (node_exporter textfile collector)
+'''
+
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+import os
+import json
+import time
+import logging
+
+from pqcom import byte_queue
+
+
+STATS_PERIOD = 1.0 # s
+EXPORT_FORMATS = ('jsonl', 'prometheus')
+
+
+class IoCounters(object):
+	'Totals updated by SerialBus: RX by RX thread, TX by TX thread, drain lag by the reader'
+
+	def __init__(self):
+		self.rx_bytes = 0
+		self.rx_chunks = 0
+		self.rx_read_max = 0 # largest chunk, bytes
+		self.tx_bytes = 0
+		self.tx_chunks = 0
+		self.opens = 0 # successful port opens: reconnects are opens - 1
+		self.errors = 0 # I/O failures of the open port
+		self.last_error = ''
+		self.drain_lag_ns = 0 # age of the oldest chunk at the last read_all()
+		self.drain_lag_max_ns = 0 # since the last sample
+
+	def received(self, size: int):
+		self.rx_bytes += size
+		self.rx_chunks += 1
+		if size > self.rx_read_max:
+			self.rx_read_max = size
+
+	def sent(self, size: int):
+		self.tx_bytes += size
+		self.tx_chunks += 1
+
+	def drained(self, lag_ns: int):
+		self.drain_lag_ns = lag_ns
+		if lag_ns > self.drain_lag_max_ns:
+			self.drain_lag_max_ns = lag_ns
+
+	def failed(self, e, is_open=True):
+		if is_open:
+			self.errors += 1
+		self.last_error = str(e)
+
+
+class IoStats(NamedTuple):
+	port: str
+	time: float # wall clock of the sample, s
+	rx_bytes: int
+	rx_chunks: int
+	tx_bytes: int
+	tx_chunks: int
+	rx_rate: float # B/s
+	rx_chunk_rate: float # chunks/s
+	tx_rate: float
+	tx_chunk_rate: float
+	rx_read_avg: float # bytes per chunk in the interval
+	rx_read_max: int
+	rx_queue: byte_queue.QueueStats
+	tx_queue: byte_queue.QueueStats
+	reconnects: int
+	errors: int
+	last_error: str
+	drain_lag: float # s; the last one
+	drain_lag_max: float # s; max in the interval
+
+	def __str__(self) -> str:
+		ret = 'RX {}/s {:.0f} ch/s, TX {}/s; queued RX {} TX {}; lag {:.0f} ms'.format(
+			byte_queue.format_size(self.rx_rate), self.rx_chunk_rate, byte_queue.format_size(self.tx_rate),
+			byte_queue.format_size(self.rx_queue.queued_bytes), byte_queue.format_size(self.tx_queue.queued_bytes),
+			self.drain_lag_max * 1000)
+		dropped = self.rx_queue.dropped_bytes + self.tx_queue.dropped_bytes
+		if dropped:
+			ret += '; dropped ' + byte_queue.format_size(dropped)
+		if self.reconnects:
+			ret += '; reconnects {}'.format(self.reconnects)
+		return ret
+
+	def to_dict(self) -> dict:
+		ret = self._asdict()
+		ret['rx_queue'] = self.rx_queue._asdict()
+		ret['tx_queue'] = self.tx_queue._asdict()
+		return ret
+
+
+class StatsSampler(object):
+	'Samples bus counters: rates are of the interval since the previous sample'
+
+	def __init__(self, bus):
+		self.bus = bus
+		self._last: Optional[IoStats] = None
+		self._last_monotonic = time.monotonic()
+
+	def sample(self) -> IoStats:
+		bus = self.bus
+		counters = bus.counters
+		now = time.monotonic()
+		interval = max(now - self._last_monotonic, 1e-9)
+		last = self._last
+		rx_bytes, rx_chunks = counters.rx_bytes, counters.rx_chunks
+		tx_bytes, tx_chunks = counters.tx_bytes, counters.tx_chunks
+		delta_rx = rx_bytes - last.rx_bytes if last else rx_bytes
+		delta_chunks = rx_chunks - last.rx_chunks if last else rx_chunks
+		rx_queue, tx_queue = bus.queue_stats()
+		drain_lag_max, counters.drain_lag_max_ns = counters.drain_lag_max_ns, 0
+		self._last = stats = IoStats(bus.port, time.time(), rx_bytes, rx_chunks, tx_bytes, tx_chunks,
+			delta_rx / interval, delta_chunks / interval,
+			(tx_bytes - last.tx_bytes if last else tx_bytes) / interval,
+			(tx_chunks - last.tx_chunks if last else tx_chunks) / interval,
+			delta_rx / delta_chunks if delta_chunks else 0.0, counters.rx_read_max,
+			rx_queue, tx_queue, max(0, counters.opens - 1), counters.errors, counters.last_error,
+			counters.drain_lag_ns / 1e9, drain_lag_max / 1e9)
+		self._last_monotonic = now
+		return stats
+
+
+# Prometheus metrics: name, type, help, value of IoStats
+METRICS = (
+	('pqcom_rx_bytes_total', 'counter', 'Received bytes', lambda s: s.rx_bytes),
+	('pqcom_rx_chunks_total', 'counter', 'Received chunks (reads)', lambda s: s.rx_chunks),
+	('pqcom_tx_bytes_total', 'counter', 'Sent bytes', lambda s: s.tx_bytes),
+	('pqcom_tx_chunks_total', 'counter', 'Sent chunks (writes)', lambda s: s.tx_chunks),
+	('pqcom_rx_bytes_per_second', 'gauge', 'RX rate of the last period', lambda s: s.rx_rate),
+	('pqcom_tx_bytes_per_second', 'gauge', 'TX rate of the last period', lambda s: s.tx_rate),
+	('pqcom_rx_read_size_avg_bytes', 'gauge', 'Average read size of the last period', lambda s: s.rx_read_avg),
+	('pqcom_rx_read_size_max_bytes', 'gauge', 'Largest read', lambda s: s.rx_read_max),
+	('pqcom_rx_queue_bytes', 'gauge', 'Queued RX bytes', lambda s: s.rx_queue.queued_bytes),
+	('pqcom_tx_queue_bytes', 'gauge', 'Queued TX bytes', lambda s: s.tx_queue.queued_bytes),
+	('pqcom_rx_dropped_bytes_total', 'counter', 'RX bytes dropped by queue policy', lambda s: s.rx_queue.dropped_bytes),
+	('pqcom_tx_dropped_bytes_total', 'counter', 'TX bytes dropped by queue policy', lambda s: s.tx_queue.dropped_bytes),
+	('pqcom_reconnects_total', 'counter', 'Port reopens', lambda s: s.reconnects),
+	('pqcom_errors_total', 'counter', 'I/O failures of the open port', lambda s: s.errors),
+	('pqcom_drain_lag_seconds', 'gauge', 'Max age of received chunks when shown in the last period',
+		lambda s: s.drain_lag_max),
+)
+
+
+def to_prometheus(stats: Iterable[IoStats]) -> str:
+	stats = list(stats)
+	lines = []
+	for name, kind, description, value in METRICS:
+		lines.append('# HELP {} {}'.format(name, description))
+		lines.append('# TYPE {} {}'.format(name, kind))
+		for s in stats:
+			port = s.port.replace('\\', '\\\\').replace('"', '\\"')
+			lines.append('{}{{port="{}"}} {}'.format(name, port, value(s)))
+	return '\n'.join(lines) + '\n'
+
+
+class StatsExporter(object):
+	'''Writes samples to the file in the export format.
+	Prometheus file has the latest sample of each port till the port is removed'''
+
+	def __init__(self, path: str, form: str='jsonl'):
+		if form not in EXPORT_FORMATS:
+			raise ValueError('Wrong stats format: ' + form)
+		self.path = path
+		self.form = form
+		self._latest: Dict[str, IoStats] = {} # port -> sample
+
+	def remove(self, port: str):
+		'Drops the port samples: port is closed'
+		self._latest.pop(port, None)
+
+	def write(self, stats: List[IoStats]):
+		'Writes samples of ports; errors are logged only'
+		try:
+			if self.form == 'jsonl':
+				with open(self.path, 'a') as f:
+					f.writelines(json.dumps(s.to_dict()) + '\n' for s in stats)
+			else:
+				for s in stats:
+					self._latest[s.port] = s
+				# scraper reads the whole file: it is replaced atomically
+				tmp = self.path + '.tmp'
+				with open(tmp, 'w') as f:
+					f.write(to_prometheus(self._latest.values()))
+				os.replace(tmp, self.path)
+		except OSError as e:
+			logging.warning('Stats export failed: %s', e)
@@ -0,0 +1,115 @@
+from typing import Callable, List, Tuple
+
+import re
+import bisect
+from array import array
+
+
+# longest match of bytes search: the tail of the scanned data is kept for matches crossing chunks
+BYTES_MAX_MATCH = 4096
+
+class LineSearch(object):
+	'''Incremental search over appended lines: each line is scanned once.
+	Lines are numbered from the first line ever appended, so numbers survive dropping of the oldest lines;
+	matches are the sorted numbers of matching lines.
+	Bytes search scans the received data of the chunks (pattern is UTF-8 encoded, \\xNN escapes of regex):
+	match crossing chunks marks all its lines'''
+
+	def __init__(self, pattern: str, is_regex=True, ignore_case=True, is_bytes=False):
+		self.pattern = pattern
+		self.is_regex = is_regex
+		self.is_bytes = is_bytes
+		flags = re.IGNORECASE if ignore_case else 0
+		if is_bytes:
+			data = pattern.encode()
+			self.regex = re.compile(data if is_regex else re.escape(data), flags)
+		else:
+			self.regex = re.compile(pattern if is_regex else re.escape(pattern), flags)
+		self.scanned = 0 # number of the next line to scan
+		# bytes search: scanned data tail & its chunk starts (offset in tail, line number)
+		self._tail = b''
+		self._tail_lines: List[Tuple[int, int]] = []
+		self._matches = array('q')
+		self._head = 0 # index of the first match in _matches
+
+	def __len__(self) -> int:
+		return len(self._matches) - self._head
+
+	def __getitem__(self, index: int) -> int:
+		if index < 0 or index >= len(self):
+			raise IndexError('Match index out of range')
+		return self._matches[self._head + index]
+
+	def scan(self, lines: Callable[[int, int], List], first_line: int, end_line: int, limit: int) -> List[int]:
+		'''Scans up to limit of not scanned lines of first_line..end_line (exclusive);
+		lines(start, stop) gets lines by numbers: rendered lines or records (timestamp ns, bytes) & notice lines
+		of bytes search. Gets numbers of the new matching lines: they are added by extend()'''
+		start = max(self.scanned, first_line)
+		stop = min(end_line, start + limit)
+		if self.is_bytes:
+			if start > self.scanned:
+				# the lines of the tail are dropped
+				self._tail, self._tail_lines = b'', []
+			# matches crossing the dropped lines are of the lines kept only
+			ret = [n for n in self._scan_bytes(lines(start, stop), start) if n >= first_line]
+		else:
+			search = self.regex.search
+			ret = [n for n, line in enumerate(lines(start, stop), start) if search(line)]
+		self.scanned = max(self.scanned, stop)
+		return ret
+
+	def _scan_bytes(self, records, start: int) -> List[int]:
+		ret: List[int] = []
+		last = self._matches[-1] if len(self) else -1
+		parts = [self._tail]
+		bounds = list(self._tail_lines)
+		size = new = len(self._tail)
+		for n, record in enumerate(records, start):
+			if isinstance(record, str):
+				# notice breaks the stream: e.g. the port is reopened
+				last = self._search_bytes(b''.join(parts), bounds, new, last, ret)
+				parts, bounds, size, new = [], [], 0, 0
+				continue
+			bounds.append((size, n))
+			parts.append(record[1])
+			size += len(record[1])
+		data = b''.join(parts)
+		self._search_bytes(data, bounds, new, last, ret)
+		cut = max(0, len(data) - BYTES_MAX_MATCH)
+		first = max(0, bisect.bisect_right(bounds, (cut, float('inf'))) - 1)
+		self._tail = data[cut:]
+		self._tail_lines = [(max(0, offset - cut), n) for offset, n in bounds[first:]]
+		return ret
+
+	def _search_bytes(self, data: bytes, bounds: List[Tuple[int, int]], new: int, last: int, ret: List[int]) -> int:
+		'''Adds numbers of the lines of matches ending in the new data (from the offset new) to ret;
+		last is the last matching line. Gets the last matching line'''
+		if not bounds or len(data) == new:
+			return last
+		offsets = [offset for offset, _ in bounds]
+		for m in self.regex.finditer(data, max(0, new - BYTES_MAX_MATCH + 1)):
+			if m.end() <= new:
+				# found by the previous scan
+				continue
+			first = bounds[bisect.bisect_right(offsets, m.start()) - 1][1]
+			end = bounds[bisect.bisect_right(offsets, max(m.start(), m.end() - 1)) - 1][1]
+			for n in range(max(first, last + 1), end + 1):
+				ret.append(n)
+			last = max(last, end)
+		return last
+
+	def extend(self, matches: List[int]):
+		self._matches.extend(matches)
+
+	def count_before(self, line: int) -> int:
+		'Gets count of matches before the line number'
+		return bisect.bisect_left(self._matches, line, self._head) - self._head
+
+	def discard_before(self, line: int) -> int:
+		'Drops matches of the lines before the line number; returns count of dropped'
+		count = self.count_before(line)
+		self._head += count
+		if self._head > 4096 and self._head * 2 > len(self._matches):
+			del self._matches[:self._head]
+			self._head = 0
+		return count
@@ -1,38 +1,54 @@
 #!/usr/bin/env python3
 
 
-from typing import Iterable, Optional
+from typing import Dict, Iterable, List, Tuple
 
 import sys
 import os
-import subprocess
-import threading
-from time import sleep
-import pickle
-import argparse
-import codecs
-from datetime import datetime
-
-from PyQt5.QtGui import QIcon, QKeySequence, QTextCursor
-from PyQt5.QtWidgets import QApplication, QMainWindow, QDialog, QAction, QActionGroup, QMenu, QShortcut
-from PyQt5.QtCore import Qt, pyqtSignal as Signal
+import re
+import copy
+import time
+from collections import OrderedDict
+
+from PyQt5.QtGui import QIcon, QKeySequence
+from PyQt5.QtWidgets import QApplication, QMainWindow, QDialog, QAction, QActionGroup, QMenu, QShortcut, QSpinBox, \
+	QFileDialog, QLineEdit, QLabel, QComboBox
+from PyQt5.QtCore import Qt, QObject, QTimer, pyqtSignal as Signal
 # from PyQt5 import QtSvg
 
+from pqcom import cli
 from pqcom import serial_bus
 from pqcom import pqcom_translator as translator
 from pqcom import setup_dialog
 from pqcom import about_ui
 from pqcom import main_ui
+from pqcom.repeater import Repeater
+from pqcom import sequence
+from pqcom import framing
+from pqcom import port_watcher
+from pqcom import store
+from pqcom import profiling
+from pqcom.tracer import tracer
 from pqcom.util import resource_path
 
 
-PQCOM_DATA_FILE = os.path.join(os.path.expanduser('~'), '.pqcom_data3')
 ICON_LIB = {'N': 'img/normal.svg', 'H': 'img/0x.svg', 'E': 'img/ex.svg'}
 
 DEFAULT_EOF = '\n'
+FRAMER_POLL_PERIOD = 20 # ms
+RECONNECT_PERIOD = 500 # ms
+RECONNECT_FALLBACK_PERIOD = 2000 # ms
+HISTORY_SIZE = 100 # items; the least recently sent item is dropped
 
-serial: Optional[serial_bus.SerialBus] = None
 
+_icons: Dict[str, QIcon] = {}
+
+def get_icon(name: str) -> QIcon:
+	'Gets icon by ICON_LIB key or resource path; icons are loaded once'
+	icon = _icons.get(name)
+	if icon is None:
+		icon = _icons[name] = QIcon(resource_path(ICON_LIB.get(name, name)))
+	return icon
 
 class AboutDialog(QDialog, about_ui.Ui_Dialog):
 	def __init__(self, parent=None):
@@ -40,30 +56,112 @@ class AboutDialog(QDialog, about_ui.Ui_Dialog):
 		self.setupUi(self)
 		self.setWindowFlags(self.windowFlags() ^ Qt.WindowContextHelpButtonHint)
 
+class Collections(QObject):
+	'Collections of all port windows of the process: windows update their menus by the signals'
+	added = Signal(str, str) # form, raw
+	removed = Signal(int) # index
+	cleared = Signal()
+
+	def __init__(self, store: store.Store, parent=None):
+		super(Collections, self).__init__(parent)
+		self.store = store
+		self.items = [list(item) for item in store.collections()]
+
+	def add(self, form: str, raw: str):
+		if [form, raw] in self.items:
+			return
+		self.items.append([form, raw])
+		self.store.add_collection(form, raw)
+		self.added.emit(form, raw)
+
+	def remove(self, index: int):
+		form, raw = self.items.pop(index)
+		self.store.remove_collection(form, raw)
+		self.removed.emit(index)
+
+	def clear(self):
+		self.items = []
+		self.store.remove_all_collections()
+		self.cleared.emit()
+
+class RxDispatcher(QObject):
+	'''Port windows of the process: RX notifications of all ports go to GUI thread through one queued signal;
+	the windows share the store & collections'''
+	received = Signal(object)
+
+	def __init__(self, engine=None, capture=None, spill=None, stats_exporter=None, parent=None):
+		super(RxDispatcher, self).__init__(parent)
+		self.store = store.Store()
+		self.collections = Collections(self.store, self)
+		self.engine = engine # shared I/O engine of ports or None for thread pair per port
+		self.capture = capture # capture writer of all ports or None
+		self.spill = spill # capture writer of RX chunks spilled from full queues or None
+		self.stats_exporter = stats_exporter # I/O statistics file writer of all ports or None
+		self.windows: List['MainWindow'] = []
+		self.received.connect(self._dispatch)
+
+	def register(self, window: 'MainWindow'):
+		self.windows.append(window)
+
+	def unregister(self, window: 'MainWindow'):
+		if window in self.windows:
+			self.windows.remove(window)
+
+	def notify(self, window: 'MainWindow'):
+		'Called from RX thread'
+		self.received.emit(window)
+
+	def _dispatch(self, window: 'MainWindow'):
+		# window may be closed while notification is queued
+		if window in self.windows:
+			window.display()
+
 class MainWindow(QMainWindow, main_ui.Ui_MainWindow):
 	serial_failed = Signal()
-	data_received = Signal()
+	ports_changed = Signal()
+	script_status = Signal()
+	script_finished = Signal(bool, str)
 
-	def __init__(self, args={}, parent=None):
+	def __init__(self, args={}, dispatcher=None, parent=None):
 		super(MainWindow, self).__init__(parent)
 		self.setupUi(self)
+		self.setAttribute(Qt.WA_DeleteOnClose)
+
+		self.args = args
+		self.dispatcher = dispatcher if dispatcher else RxDispatcher(parent=self)
+		self.dispatcher.register(self)
+		self.serial = serial_bus.SerialBus(self.on_data_received, self.on_serial_failed, self.dispatcher.engine)
+		if self.dispatcher.capture:
+			self.serial.add_listener(self.dispatcher.capture.on_chunk)
+		cli.configure_queues(self.serial, args, self.dispatcher.spill)
+		try:
+			self.bridge = cli.create_bridge(self.serial, args)
+		except OSError as e:
+			self.bridge = None
+			self.statusBar().showMessage('Bridge {}: {}'.format(args.bridge, e))
 
-		self.setWindowIcon(QIcon(resource_path('img/pqcom-logo.png')))
+		self.setWindowIcon(get_icon('img/pqcom-logo.png'))
 
 		self.is_last_error = False # is last error or receiving data
 		self._reconnect_timer_id = -1
 
-		self.aboutDialog = AboutDialog(self)
-		self.setupDialog = setup_dialog.SetupDialog(self)
-		self.setupDialog.set_baud(args.baudrate)
-		if args.port_parameters and len(args.port_parameters) > 2:
-			self.setupDialog.set_bytebits(int(args.port_parameters[0]))
-			self.setupDialog.set_parity(args.port_parameters[1])
-			self.setupDialog.set_stopbits(args.port_parameters[2:])
-		if args.vid_pid:
-			self.setupDialog.set_vidpid(args.vid_pid)
-		if args.r:
-			self.setupDialog.set_reconnect()
+		# dialogs are created on first use
+		self._aboutDialog = None
+		self._setupDialog = None
+		self.oRecievedData.set_max_lines(args.max_lines)
+		self.oRecievedData.set_max_bytes(args.max_bytes)
+		self.read_size = args.read_size
+		self.inter_byte_timeout = args.inter_byte_timeout
+		self.framer = framing.create_framer(args.framing)
+		# frame completed by RX idle gap is shown without waiting for the next chunk
+		self.framerTimer = QTimer(self)
+		self.framerTimer.setSingleShot(True)
+		self.framerTimer.setInterval(FRAMER_POLL_PERIOD)
+		self.framerTimer.timeout.connect(self.poll_framer)
+		# received chunks are kept as bytes & rendered by the view on demand
+		self.renderer = self.oRecievedData.renderer
+		self.renderer.set_encoding(args.encoding)
+		self.renderer.set_timestamps(args.timestamps)
 
 		# self.actionNew.setIcon(QIcon(resource_path('img/new.svg')))
 		# self.actionSetup.setIcon(QIcon(resource_path('img/settings.svg')))
@@ -89,6 +187,46 @@ class MainWindow(QMainWindow, main_ui.Ui_MainWindow):
 		self.actionAppendEol = QAction('Append extra EOL', self)
 		self.actionAppendEol.setCheckable(True)
 
+		self.actionScript = QAction('Script...', self)
+		self.actionScript.setCheckable(True)
+		self.actionScript.setToolTip('Run/stop send/expect script')
+		self.toolBar.insertAction(self.actionShowSend, self.actionScript)
+		self.sequenceRunner = sequence.SequenceRunner(self.serial,
+			self.script_finished.emit, self._on_script_step)
+		self._script_step = None
+		# one status signal is pending regardless of step rate, as RX notifications
+		self._script_status_pending = False
+
+		self.encodingComboBox = QComboBox(self)
+		self.encodingComboBox.setToolTip('RX text encoding: bytes - ASCII with \\xNN escapes')
+		self.encodingComboBox.addItems(translator.ENCODINGS)
+		if args.encoding not in translator.ENCODINGS:
+			self.encodingComboBox.addItem(args.encoding)
+		self.encodingComboBox.setCurrentText(args.encoding)
+		self.toolBar.insertWidget(self.actionClear, self.encodingComboBox)
+		self.timestampsComboBox = QComboBox(self)
+		self.timestampsComboBox.setToolTip('RX timestamps: local time, seconds since the first chunk or none')
+		self.timestampsComboBox.addItems(translator.TIMESTAMP_FORMATS)
+		self.timestampsComboBox.setCurrentText(args.timestamps)
+		self.toolBar.insertWidget(self.actionClear, self.timestampsComboBox)
+
+		# search
+		self.searchEdit = QLineEdit(self)
+		self.searchEdit.setPlaceholderText('Find (regex)')
+		self.searchEdit.setToolTip('Search received lines: Enter/F3 - next, Shift+F3 - previous')
+		self.searchEdit.setClearButtonEnabled(True)
+		self.searchEdit.setMaximumWidth(200)
+		self.actionFilter = QAction('Filter', self)
+		self.actionFilter.setCheckable(True)
+		self.actionFilter.setToolTip('Show only lines matching the search')
+		self.actionSearchBytes = QAction('Bytes', self)
+		self.actionSearchBytes.setCheckable(True)
+		self.actionSearchBytes.setToolTip('Search received bytes, also across chunks: \\xNN escapes, e.g. \\x02.*?\\x03')
+		self.toolBar.addSeparator()
+		self.toolBar.addWidget(self.searchEdit)
+		self.toolBar.addAction(self.actionSearchBytes)
+		self.toolBar.addAction(self.actionFilter)
+
 		# popup menu
 		popupMenu = QMenu(self)
 		popupMenu.addAction(self.actionUseCR)
@@ -98,34 +236,46 @@ class MainWindow(QMainWindow, main_ui.Ui_MainWindow):
 		popupMenu.addAction(self.actionAppendEol)
 		self.sendButton.setMenu(popupMenu)
 
-		# history
-		self.output_history = []
-		self.repeater = Repeater()
-		self.outputHistoryActions = []
+		self.repeater = Repeater(self.serial)
+		self.repeaterStatusTimer = QTimer(self)
+		self.repeaterStatusTimer.setInterval(1000)
+		self.repeaterStatusTimer.timeout.connect(self._show_repeater_status)
+		self.statsSampler = self.serial.create_sampler()
+		self.ioStatusLabel = QLabel(self)
+		self.statusBar().addPermanentWidget(self.ioStatusLabel)
+		self.statsTimer = QTimer(self)
+		self.statsTimer.setInterval(int(args.stats_period * 1000))
+		self.statsTimer.timeout.connect(self._show_io_status)
+		self.statsTimer.start()
+
+		self.store = self.dispatcher.store
+		self.collections = self.dispatcher.collections
+		history = self.store.history(HISTORY_SIZE)
+
+		# history: MRU (form, raw) -> menu action; the most recent item is the last one & the menu top
+		self.output_history: 'OrderedDict[Tuple[str, str], QAction]' = OrderedDict()
 		self.outputHistoryMenu = QMenu(self)
-		self.outputHistoryMenu.addAction('None')
+		self.historyNoneAction = self.outputHistoryMenu.addAction('None')
 		self.historyButton.setMenu(self.outputHistoryMenu)
+		for form, raw in history[-HISTORY_SIZE:]:
+			self.add_history(form, raw)
 
 		self.collectActions = []
 		self.collectMenu = QMenu(self)
 		self.collectMenu.setTearOffEnabled(True)
-		self.collections = []
-		try:
-			saved = open(PQCOM_DATA_FILE, 'rb')
-			self.collections = pickle.load(saved)
-			saved.close()
-		except IOError:
-			pass
-		if not self.collections:
+		if not self.collections.items:
 			self.collectMenu.addAction('None')
 		else:
-			for item in self.collections:
-				icon = QIcon(resource_path(ICON_LIB[item[0]]))
+			for item in self.collections.items:
+				icon = get_icon(item[0])
 				action = self.collectMenu.addAction(icon, item[1])
 				self.collectActions.append(action)
+		self.collections.added.connect(self._on_collection_added)
+		self.collections.removed.connect(self._on_collection_removed)
+		self.collections.cleared.connect(self._on_collections_cleared)
 
 		self.collectButton.setMenu(self.collectMenu)
-		self.collectButton.setIcon(QIcon(resource_path('img/star.svg')))
+		self.collectButton.setIcon(get_icon('img/star.svg'))
 
 		self.collectMenu.setContextMenuPolicy(Qt.CustomContextMenu)
 		# self.connect(self.collectMenu, QtCore.SIGNAL('customContextMenuRequested(const QPoint&)'),
@@ -149,9 +299,18 @@ class MainWindow(QMainWindow, main_ui.Ui_MainWindow):
 		self.actionNew.triggered.connect(self.new)
 		self.actionRun.toggled.connect(self.run)
 		self.actionHex.toggled.connect(self.convert)
+		self.encodingComboBox.currentTextChanged.connect(self.oRecievedData.set_encoding)
+		self.timestampsComboBox.currentTextChanged.connect(self.oRecievedData.set_timestamps)
 		self.actionClear.triggered.connect(self.clear)
 		self.actionPin.toggled.connect(self.pin)
-		self.actionAbout.triggered.connect(self.aboutDialog.show)
+		self.actionAbout.triggered.connect(lambda: self.aboutDialog.show())
+		self.actionScript.toggled.connect(self.run_script)
+		self.script_status.connect(self._show_script_status)
+		self.script_finished.connect(self.on_script_finished)
+		self.searchEdit.textChanged.connect(self.search)
+		self.searchEdit.returnPressed.connect(self.find_next)
+		self.actionFilter.toggled.connect(self.oRecievedData.set_filter)
+		self.actionSearchBytes.toggled.connect(lambda is_true: self.search(self.searchEdit.text()))
 		self.show_send(False)
 		self.actionShowSend.toggled.connect(self.show_send)
 		self.outputHistoryMenu.triggered.connect(self.on_history_item_clicked)
@@ -159,9 +318,15 @@ class MainWindow(QMainWindow, main_ui.Ui_MainWindow):
 		self.collectMenu.triggered.connect(self.on_collect_item_clicked)
 
 		self.serial_failed.connect(self.handle_serial_error)
-		self.data_received.connect(self.display)
+		# hotplug: reconnect & setup dialog port list are updated at once
+		self.ports_changed.connect(self.on_ports_changed)
+		self._on_ports = lambda ports: self.ports_changed.emit()
+		self._is_watching_ports = False
 
 		QShortcut(QKeySequence('Ctrl+Return'), self.sendPlainTextEdit, self.send)
+		QShortcut(QKeySequence.Find, self, self.searchEdit.setFocus)
+		QShortcut(QKeySequence.FindNext, self, self.find_next)
+		QShortcut(QKeySequence.FindPrevious, self, self.find_previous)
 
 		def gen_shortcut_callback(n):
 			def on_shortcut():
@@ -173,25 +338,76 @@ class MainWindow(QMainWindow, main_ui.Ui_MainWindow):
 			QShortcut(QKeySequence('Ctrl+' + str(i)), self, gen_shortcut_callback(i))
 
 		# self.extendRadioButton.setVisible(False)
+		self.periodSpinBox.setDecimals(6)
+		self.periodSpinBox.setMinimum(0.00001)
+		self.periodSpinBox.setSingleStep(0.001)
 		self.periodSpinBox.setVisible(False)
+		self.burstSpinBox = QSpinBox(self.oSendControlsPane)
+		self.burstSpinBox.setRange(1, 10000)
+		self.burstSpinBox.setPrefix('x')
+		self.burstSpinBox.setToolTip('Frames per period')
+		self.horizontalLayout.insertWidget(self.horizontalLayout.indexOf(self.repeatCheckBox), self.burstSpinBox)
+		self.burstSpinBox.setVisible(False)
 
 		self._show_port_status()
 
+	@property
+	def aboutDialog(self) -> AboutDialog:
+		if self._aboutDialog is None:
+			self._aboutDialog = AboutDialog(self)
+		return self._aboutDialog
+
+	@property
+	def setupDialog(self) -> setup_dialog.SetupDialog:
+		if self._setupDialog is None:
+			args = self.args
+			self._setupDialog = setup_dialog.SetupDialog(self)
+			self._setupDialog.set_baud(args.baudrate)
+			if args.port_parameters and len(args.port_parameters) > 2:
+				self._setupDialog.set_bytebits(int(args.port_parameters[0]))
+				self._setupDialog.set_parity(args.port_parameters[1])
+				self._setupDialog.set_stopbits(args.port_parameters[2:])
+			if args.vid_pid:
+				self._setupDialog.set_vidpid(args.vid_pid)
+			if args.r:
+				self._setupDialog.set_reconnect()
+		return self._setupDialog
+
 	def _show_port_status(self):
-		if serial:
-			self.setWindowTitle('pqcom - ' + serial.port_and_properties + (' opened' if serial.is_open else ' closed'))
+		if self.serial.port:
+			self.setWindowTitle('pqcom - ' + self.serial.port_and_properties + (' opened' if self.serial.is_open else ' closed'))
 		else:
 			self.setWindowTitle('pqcom')
 
-	def new(self):
-		save = open(PQCOM_DATA_FILE, 'wb')
-		pickle.dump(self.collections, save)
-		save.close()
+	def _show_io_status(self):
+		stats = self.statsSampler.sample()
+		text = str(stats)
+		if self.bridge:
+			text += '; bridge {}:{} clients {}'.format(*self.bridge.address, len(self.bridge.clients))
+		self.ioStatusLabel.setText(text)
+		self.ioStatusLabel.setToolTip('Received: {} bytes, {} chunks; read size: {:.0f} average, {} max\n'
+			'Sent: {} bytes, {} chunks\nQueues: RX {}; TX {}\nReconnects: {}; errors: {}{}'.format(
+			stats.rx_bytes, stats.rx_chunks, stats.rx_read_avg, stats.rx_read_max, stats.tx_bytes, stats.tx_chunks,
+			stats.rx_queue, stats.tx_queue, stats.reconnects, stats.errors,
+			'; last: ' + stats.last_error if stats.last_error else ''))
+		if self.dispatcher.stats_exporter and self.serial.port:
+			self.dispatcher.stats_exporter.write([stats])
+
+	def _show_repeater_status(self):
+		self.statusBar().showMessage('Repeat: ' + str(self.repeater.stats))
+		if not self.repeater.is_running:
+			self.repeaterStatusTimer.stop()
 
-		args = sys.argv
-		if args != [sys.executable]:
-			args = [sys.executable] + args
-		subprocess.Popen(args)
+	def new(self):
+		# new port window in this process, shares RX dispatcher
+		args = copy.copy(self.args)
+		args.r = False
+		args.x = False
+		# the bridge address is taken by this window
+		args.bridge = None
+		window = MainWindow(args=args, dispatcher=self.dispatcher)
+		window.show()
+		window.setup()
 
 	def send(self):
 		if self.repeatCheckBox.isChecked():
@@ -211,50 +427,95 @@ class MainWindow(QMainWindow, main_ui.Ui_MainWindow):
 				data = data.replace('\n', '\r\n')
 			elif self.actionUseCR.isChecked():
 				data = data.replace('\n', '\r')
+			data = data.encode()
 		elif self.hexRadioButton.isChecked():
 			form = 'H'
 			data = translator.from_hex_string(data)
 		else:
 			form = 'E'
-			data = translator.from_extended_string(data)
+			data = translator.from_extended_string(data).encode()
 
 		if self.repeatCheckBox.isChecked():
-			self.repeater.start(data, self.periodSpinBox.value())
+			self.repeater.start(data, self.periodSpinBox.value(), self.burstSpinBox.value())
+			self.repeaterStatusTimer.start()
 			self.sendButton.setText('Stop')
 		else:
-			serial.write(data)
-
-		# record history
-		record = [form, raw, data]
-		if record in self.output_history:
-			self.output_history.remove(record)
-
-		self.output_history.insert(0, record)
+			self.serial.write(data)
 
-		self.outputHistoryActions = []
-		self.outputHistoryMenu.clear()
-		for item in self.output_history:
-			icon = QIcon(resource_path(ICON_LIB[item[0]]))
+		self.add_history(form, raw)
+		self.store.add_history(form, raw, data, HISTORY_SIZE)
 
-			action = self.outputHistoryMenu.addAction(icon, item[1])
-			self.outputHistoryActions.append(action)
+	def add_history(self, form: str, raw: str):
+		'Moves or inserts one history menu action to the top'
+		key = (form, raw)
+		action = self.output_history.get(key)
+		if action is not None:
+			if action is self.outputHistoryMenu.actions()[0]:
+				return
+			self.output_history.move_to_end(key)
+			self.outputHistoryMenu.removeAction(action)
+		else:
+			if self.historyNoneAction:
+				self.outputHistoryMenu.removeAction(self.historyNoneAction)
+				self.historyNoneAction = None
+			action = QAction(get_icon(form), raw, self.outputHistoryMenu)
+			action.setData(key)
+			self.output_history[key] = action
+			if len(self.output_history) > HISTORY_SIZE:
+				_, oldest = self.output_history.popitem(last=False)
+				self.outputHistoryMenu.removeAction(oldest)
+				oldest.deleteLater()
+		actions = self.outputHistoryMenu.actions()
+		self.outputHistoryMenu.insertAction(actions[0] if actions else None, action)
 
 	def repeat(self, is_true):
 		if is_true:
 			self.periodSpinBox.setVisible(True)
+			self.burstSpinBox.setVisible(True)
 			self.sendButton.setText('Start')
 		else:
 			self.periodSpinBox.setVisible(False)
+			self.burstSpinBox.setVisible(False)
 			self.sendButton.setText('Send')
 			self.repeater.stop()
 
+	def run_script(self, is_true):
+		if not is_true:
+			self.sequenceRunner.stop()
+			return
+		path, _ = QFileDialog.getOpenFileName(self, 'Run script')
+		steps = None
+		if path:
+			try:
+				steps = sequence.load_script(path)
+			except (IOError, sequence.SequenceError) as e:
+				self.statusBar().showMessage('Script: {}'.format(e))
+		if steps:
+			self.sequenceRunner.start(steps)
+		else:
+			self.actionScript.setChecked(False)
+
+	def _on_script_step(self, step):
+		'Sequence thread: the latest step is shown'
+		self._script_step = step
+		if not self._script_status_pending:
+			self._script_status_pending = True
+			self.script_status.emit()
+
+	def _show_script_status(self):
+		self._script_status_pending = False
+		self.statusBar().showMessage('Script: ' + str(self._script_step))
+
+	def on_script_finished(self, ok, message):
+		self.statusBar().showMessage('Script: ' + message)
+		self.actionScript.setChecked(False)
+
 	def on_history_item_clicked(self, action):
-		try:
-			index = self.outputHistoryActions.index(action)
-		except ValueError:
+		key = action.data()
+		if key not in self.output_history:
 			return
 
-		form, raw, data = self.output_history[index]
+		form, raw = key
 		if form == 'H':
 			self.hexRadioButton.setChecked(True)
 		elif form == 'E':
@@ -267,8 +528,6 @@ class MainWindow(QMainWindow, main_ui.Ui_MainWindow):
 		self.send()
 
 	def collect(self):
-		if not self.collections:
-			self.collectMenu.clear()
 		raw = str(self.sendPlainTextEdit.toPlainText())
 		form = 'N'
 		if self.hexRadioButton.isChecked():
@@ -276,12 +535,13 @@ class MainWindow(QMainWindow, main_ui.Ui_MainWindow):
 		elif self.extendRadioButton.isChecked():
 			form = 'E'
 
-		item = [form, raw]
-		if item in self.collections:
-			return
+		# menus of all windows are updated by the signal
+		self.collections.add(form, raw)
 
-		self.collections.append(item)
-		icon = QIcon(resource_path(ICON_LIB[form]))
+	def _on_collection_added(self, form, raw):
+		if not self.collectActions:
+			self.collectMenu.clear()
+		icon = get_icon(form)
 		action = self.collectMenu.addAction(icon, raw)
 		self.collectActions.append(action)
 
@@ -297,8 +557,8 @@ class MainWindow(QMainWindow, main_ui.Ui_MainWindow):
 		self.send_collection(index)
 
 	def send_collection(self, index):
-		if len(self.collections) > index:
-			form, raw = self.collections[index]
+		if len(self.collections.items) > index:
+			form, raw = self.collections.items[index]
 			if form == 'H':
 				self.hexRadioButton.setChecked(True)
 			elif form == 'E':
@@ -316,29 +576,22 @@ class MainWindow(QMainWindow, main_ui.Ui_MainWindow):
 		except ValueError:
 			return
 
-		del self.collectActions[index]
-		del self.collections[index]
+		self.collections.remove(index)
 
-		self.collectMenu.clear()
-		for item in self.collections:
-			icon = QIcon(resource_path(ICON_LIB[item[0]]))
-			action = self.collectMenu.addAction(icon, item[1])
-			self.collectActions.append(action)
+	def remove_all_collections(self):
+		self.collections.clear()
 
-		save = open(PQCOM_DATA_FILE, 'wb')
-		pickle.dump(self.collections, save)
-		save.close()
+	def _on_collection_removed(self, index):
+		action = self.collectActions.pop(index)
+		self.collectMenu.removeAction(action)
+		if not self.collectActions:
+			self.collectMenu.addAction('None')
 
-	def remove_all_collections(self):
+	def _on_collections_cleared(self):
 		self.collectMenu.clear()
-		self.collections = []
 		self.collectActions = []
 		self.collectMenu.addAction('None')
 
-		save = open(PQCOM_DATA_FILE, 'wb')
-		save.close()
-		pickle.dump(self.collections, save)
-
 	def on_serial_failed(self):
 		if self.sendButton.text().find('Stop') >= 0:
 			self.repeater.stop()
@@ -347,20 +600,40 @@ class MainWindow(QMainWindow, main_ui.Ui_MainWindow):
 
 	def handle_serial_error(self):
 		if not self.is_last_error:
-			self.oRecievedData.insertPlainText('<Error {}>\n'.format(serial.port))
+			self.oRecievedData.append_lines(['<Error {}>'.format(self.serial.port)])
 			self.is_last_error = True
 		self.actionRun.setChecked(False)
 		if self.setupDialog.reconnect:
 			if self._reconnect_timer_id < 0:
-				self._reconnect_timer_id = self.startTimer(500)
+				# with hotplug events the timer is a fallback only: port may be busy
+				self._reconnect_timer_id = self.startTimer(RECONNECT_FALLBACK_PERIOD
+					if port_watcher.get_watcher().is_event_driven else RECONNECT_PERIOD)
+				self._watch_ports(True)
 		else:
 			self.setup(True)
 
+	def _watch_ports(self, is_true: bool):
+		'Port changes are watched while reconnecting or the setup dialog is shown: ports are not polled otherwise'
+		if is_true != self._is_watching_ports:
+			self._is_watching_ports = is_true
+			if is_true:
+				port_watcher.get_watcher().add_listener(self._on_ports)
+			else:
+				self._watch_ports(False)
+
+	def on_ports_changed(self):
+		if self._reconnect_timer_id >= 0:
+			self.reconnect()
+		if self._setupDialog is not None and self._setupDialog.isVisible():
+			self._setupDialog.refresh()
+
 	def on_data_received(self):
-		self.data_received.emit()
+		self.dispatcher.notify(self)
 
 	def setup(self, warning=False):
+		self._watch_ports(True)
 		choice = self.setupDialog.show(warning)
+		self._watch_ports(self._reconnect_timer_id >= 0)
 		if choice == QDialog.Accepted:
 			if self.actionRun.isChecked():
 				self.actionRun.setChecked(False)
@@ -370,32 +643,62 @@ class MainWindow(QMainWindow, main_ui.Ui_MainWindow):
 		if is_true:
 			port, vidpid, baud, bytebits, stopbits, parity = self.setupDialog.get()
 			if port or vidpid:
-				p = serial_bus.SerialParameters(baud, bytebits, stopbits, parity)
-				serial.start(parameters=p, port_name=port,
+				p = serial_bus.SerialParameters(baud, bytebits, stopbits, parity,
+					self.read_size, self.inter_byte_timeout)
+				self.serial.start(parameters=p, port_name=port,
 					vid_pid=serial_bus.SerialParameters.get_vidpid_list(vidpid))
 		else:
 			if self.sendButton.text().find('Stop') >= 0:
 				self.repeater.stop()
 				self.sendButton.setText('Start')
-			serial.join()
+			self.serial.join()
 		self._show_port_status()
 
 	def display(self):
+		# RX thread notification -> GUI thread
+		tracer.end('qt.signal', self.serial.notified_ns)
+		start = tracer.begin()
 		self.is_last_error = False
-		buff = serial.read()
-		prefix = datetime.now().strftime('%H:%M:%S.%f')+' {:02} << '.format(len(buff))
+		records = self.serial.read_all()
+		tracer.end('display.read_all', start)
+		if self.framer:
+			start = tracer.begin()
+			records = [frame for timestamp_ns, data in records for frame in self.framer.feed(timestamp_ns, data)]
+			if self.framer.pending and isinstance(self.framer, framing.IdleGapFramer):
+				self.framerTimer.start()
+			tracer.end('display.framing', start)
+		self._show_records(records)
+
+	def poll_framer(self):
+		if self.framer.pending:
+			self._show_records(self.framer.poll(time.monotonic_ns()))
+			self.framerTimer.start()
+
+	def _show_records(self, records):
+		start = tracer.begin()
+		self.oRecievedData.append_records(records)
+		tracer.end('display.append', start)
 
-		if self.actionHex.isChecked():
-			buff = str(codecs.encode(buff, 'hex'))[2:-1]
-		else:
-			buff = str(buff.decode('latin').encode('ascii', 'backslashreplace'))[2:-1]
+	def convert(self, is_true):
+		# visible lines only are rendered again
+		self.oRecievedData.set_hex(is_true)
+
+	def search(self, pattern):
+		try:
+			self.oRecievedData.set_search(pattern, is_bytes=self.actionSearchBytes.isChecked())
+			self.searchEdit.setStyleSheet('')
+		except re.error as e:
+			self.searchEdit.setStyleSheet('color: red')
+			self.statusBar().showMessage('Search: {}'.format(e))
 
-		self.oRecievedData.moveCursor(QTextCursor.End)
-		self.oRecievedData.insertPlainText(prefix + buff + '\n')
-		self.oRecievedData.moveCursor(QTextCursor.End)
+	def find_next(self, backward=False):
+		if self.oRecievedData.find(backward):
+			self.statusBar().showMessage('Found: {} lines'.format(self.oRecievedData.match_count))
+		elif self.searchEdit.text():
+			self.statusBar().showMessage('Not found')
 
-	def convert(self, is_true):
-		pass
+	def find_previous(self):
+		self.find_next(True)
 
 	def pin(self, is_true):
 		if is_true:
@@ -416,19 +719,35 @@ class MainWindow(QMainWindow, main_ui.Ui_MainWindow):
 			self.oSendPane.hide()
 
 	def closeEvent(self, event):
-		save = open(PQCOM_DATA_FILE, 'wb')
-		pickle.dump(self.collections, save)
-		save.close()
-
+		self.repeater.stop()
+		self.sequenceRunner.stop()
+		self._watch_ports(False)
+		if self.bridge:
+			self.bridge.stop()
+		if self.dispatcher.stats_exporter:
+			self.dispatcher.stats_exporter.remove(self.serial.port)
+		self.serial.join()
+		self.dispatcher.unregister(self)
+		self.collections.added.disconnect(self._on_collection_added)
+		self.collections.removed.disconnect(self._on_collection_removed)
+		self.collections.cleared.disconnect(self._on_collections_cleared)
+		if not self.dispatcher.windows:
+			self.store.close()
 		event.accept()
 
 	def timerEvent(self, event):
 		# print('Reconnect timer. is Run: ' + str(self.actionRun.isChecked()))
+		self.reconnect()
+
+	def reconnect(self):
+		'Reconnects by the fallback timer or the port hotplug'
 		if self._reconnect_timer_id >= 0:
 			self.killTimer(self._reconnect_timer_id)
 			self._reconnect_timer_id = -1
 		if not self.actionRun.isChecked():
 			self.actionRun.setChecked(True)
+		# port failure starts the timer again
+		self._watch_ports(self._reconnect_timer_id >= 0)
 		self._show_port_status()
 		# end_s = self.windowTitle()[-1]
 		# if end_s == '/':
@@ -442,76 +761,34 @@ class MainWindow(QMainWindow, main_ui.Ui_MainWindow):
 		# else:
 		#     self.setWindowTitle(self.windowTitle() + ' /')
 
-class Repeater(object):
-	def __init__(self):
-		self.stop_event = threading.Event()
-		self.period = 1
-		self.thread = None
-
-	def set_period(self, period):
-		self.period = period
-
-	def start(self, data, period):
-		self.stop_event.clear()
-		self.period = period
-		self.thread = threading.Thread(target=self.repeat, args=(data,))
-		self.thread.start()
-
-	def stop(self):
-		self.stop_event.set()
-
-	def repeat(self, data):
-		print('repeater thread is started')
-		while not self.stop_event.is_set():
-			serial.write(data)
-			sleep(self.period)
-		print('repeater thread exits')
-
-def main():
-	global serial
-
-	DEFAULT_COM_BAUDRATE = 115200
-	DEFAULT_COM_PARAMETERS = '8N1'
-
-	def pase_args():
-		parser = argparse.ArgumentParser(description='Simple serial port dump', formatter_class=argparse.RawTextHelpFormatter)
-		parser.add_argument('-p', '--port', metavar='COM_PORT', help='serial port')
-		parser.add_argument('-b', '--baudrate', metavar='BAUDRATE', default=DEFAULT_COM_BAUDRATE, type=int,
-			help='serial port baudrate; default: '+str(DEFAULT_COM_BAUDRATE))
-		parser.add_argument('--port-parameters', metavar='PARAMETERS', default=DEFAULT_COM_PARAMETERS,
-			help='serial port parameters; default: '+str(DEFAULT_COM_PARAMETERS))
-		# parser.add_argument('-v', action='count', default=0, help='verbose level: -v, -vv or -vvv (bytes); default: -v')
-		parser.add_argument('-r', action='store_true', help='reconnect to serial port')
-		parser.add_argument('-s', action='store_true', help='start and hide setup dialog')
-		parser.add_argument('-x', action='store_true', help='switch to HEX view')
-		# parser.add_argument('--bytes', action='store_true', help='receive byte by byte')
-		# parser.add_argument('--reconnect-delay', metavar='SEC', type=float, default=DEFAULT_COM_RECONNECT_DELAY,
-		# 	help='reconnect delay, s; default: '+str(DEFAULT_COM_RECONNECT_DELAY))
-		parser.add_argument('--vid-pid', metavar='VID:PID',
-			help='search for USB: VendorID:ProductID[,VendorID:ProductID[...]]; example: 03eb:2404,03eb:6124')
-		# parser.add_argument('--trace-error', action='store_true', help='show the errors trace; default: off')
-		args = parser.parse_args()
-		return args
-
-	args = pase_args()
-
-	app = QApplication(sys.argv)
-
-	window = MainWindow(args=args)
-	serial = serial_bus.SerialBus(window.on_data_received, window.on_serial_failed)
-
-	window.show()
-
-	if args.x:
-		window.actionHex.setChecked(True)
-
-	if args.r:
-		window.run(True)
-	else:
-		window.setup()
-	app.exec_()
-	serial.join()
-	sys.exit(0)
+def main(args) -> int:
+	'Runs GUI by args of cli.parse_args(); pqcom.cli.main is the entry point'
+	with profiling.session(args.profile, args.trace):
+		app = QApplication(sys.argv)
+
+		dispatcher = RxDispatcher(cli.create_io_engine(args), cli.create_capture(args), cli.create_spill(args),
+			cli.create_stats_exporter(args))
+		window = MainWindow(args=args, dispatcher=dispatcher)
+
+		window.show()
+
+		if args.x:
+			window.actionHex.setChecked(True)
+
+		if args.r:
+			window.run(True)
+		else:
+			window.setup()
+		app.exec_()
+		for window in list(dispatcher.windows):
+			window.serial.join()
+		if dispatcher.engine:
+			dispatcher.engine.stop()
+		if dispatcher.capture:
+			dispatcher.capture.close()
+		if dispatcher.spill:
+			dispatcher.spill.close()
+	return 0
 
 if __name__ == '__main__':
-	main()
+	sys.exit(cli.main())
@@ -7,6 +7,7 @@
 # WARNING! All changes made in this file will be lost!
 
 from PyQt5 import QtCore, QtGui, QtWidgets
+from pqcom.receive_view import ReceiveView
 
 class Ui_MainWindow(object):
     def setupUi(self, MainWindow):
@@ -19,7 +20,7 @@ class Ui_MainWindow(object):
         self.verticalLayout.setContentsMargins(0, 0, 0, 0)
         self.verticalLayout.setSpacing(0)
         self.verticalLayout.setObjectName("verticalLayout")
-        self.oRecievedData = QtWidgets.QTextEdit(self.centralwidget)
+        self.oRecievedData = ReceiveView(self.centralwidget)
         sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.MinimumExpanding)
         sizePolicy.setHorizontalStretch(0)
         sizePolicy.setVerticalStretch(0)
@@ -28,7 +29,6 @@ class Ui_MainWindow(object):
         font = QtGui.QFont()
         font.setFamily("Droid Sans Mono")
         self.oRecievedData.setFont(font)
-        self.oRecievedData.setReadOnly(True)
         self.oRecievedData.setObjectName("oRecievedData")
         self.verticalLayout.addWidget(self.oRecievedData)
         self.oSendPane = QtWidgets.QFrame(self.centralwidget)
@@ -134,7 +134,6 @@ class Ui_MainWindow(object):
         self.actionSetup = QtWidgets.QAction(MainWindow)
         self.actionSetup.setObjectName("actionSetup")
         self.actionNew = QtWidgets.QAction(MainWindow)
-        self.actionNew.setVisible(False)
         self.actionNew.setObjectName("actionNew")
         self.actionHex = QtWidgets.QAction(MainWindow)
         self.actionHex.setCheckable(True)
@@ -183,7 +182,7 @@ class Ui_MainWindow(object):
         self.actionSetup.setToolTip(_translate("MainWindow", "Show setup dialog"))
         self.actionNew.setText(_translate("MainWindow", "New..."))
         self.actionNew.setIconText(_translate("MainWindow", "New..."))
-        self.actionNew.setToolTip(_translate("MainWindow", "Run new pqcom and show setup dialog"))
+        self.actionNew.setToolTip(_translate("MainWindow", "Open new port window and show setup dialog"))
         self.actionHex.setText(_translate("MainWindow", "Hex"))
         self.actionHex.setToolTip(_translate("MainWindow", "View HEX format data"))
         self.actionRun.setText(_translate("MainWindow", "Open"))
@@ -0,0 +1,219 @@
+'''Cached serial port inventory updated on hotplug.
+
+On Linux the inventory is re-enumerated on inotify events of tty device nodes in /dev (device node is
+created by udev after the kernel uevent, so the port can be opened at once); elsewhere it is polled
+while the watcher has listeners, without them ports() enumerates the ports.
+'''
+
+from typing import Callable, List, NamedTuple, Optional
+
+import os
+import sys
+import struct
+import select
+import threading
+import logging
+
+from serial.tools import list_ports
+
+
+POLL_PERIOD = 1.0 # s; inventory polling when inotify is not available
+SETTLE_DELAY = 0.02 # s; events of a device hotplug are coalesced to one enumeration
+
+DEV_PATH = '/dev'
+# /dev entries of serial ports
+TTY_PREFIXES = ('tty', 'rfcomm', 'cu.')
+
+IN_ATTRIB = 0x00000004
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct('iIII') # wd, mask, cookie, name length
+
+
+class PortInfo(NamedTuple):
+	device: str
+	name: str
+	vid: Optional[int]
+	pid: Optional[int]
+	serial_number: Optional[str]
+
+
+def enumerate_ports() -> List[PortInfo]:
+	return sorted(PortInfo(p.device, p.name, p.vid, p.pid, p.serial_number) for p in list_ports.comports())
+
+
+class Inotify(object):
+	'inotify of directory by libc (Linux)'
+
+	def __init__(self, path: str, mask: int):
+		# ctypes is slow to import: it is imported when the watcher is started
+		import ctypes
+		import ctypes.util
+		libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+		self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+		if self.fd < 0:
+			raise OSError(ctypes.get_errno(), 'inotify_init1')
+		if libc.inotify_add_watch(self.fd, path.encode(), mask) < 0:
+			e = ctypes.get_errno()
+			os.close(self.fd)
+			raise OSError(e, 'inotify_add_watch: ' + path)
+
+	def read_names(self) -> List[str]:
+		'Gets names of the changed entries'
+		ret = []
+		try:
+			data = os.read(self.fd, 64 * 1024)
+		except BlockingIOError:
+			return ret
+		offset = 0
+		while offset + INOTIFY_EVENT.size <= len(data):
+			_, _, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+			offset += INOTIFY_EVENT.size
+			ret.append(data[offset:offset + length].rstrip(b'\0').decode(errors='replace'))
+			offset += length
+		return ret
+
+	def close(self):
+		os.close(self.fd)
+
+
+class PortWatcher(object):
+	'''Keeps port inventory: ports() does not enumerate ports.
+	Listeners listener(ports) are called in the watcher thread on tty device changes.'''
+
+	def __init__(self, poll_period: float=POLL_PERIOD):
+		self.poll_period = poll_period
+		self._lock = threading.Lock()
+		self._ports: List[PortInfo] = []
+		self._listeners: List[Callable] = []
+		self._thread: Optional[threading.Thread] = None
+		self._stopping = False
+		self._wake_r = -1
+		self._wake_w = -1
+		self._inotify: Optional[Inotify] = None
+
+	@property
+	def is_event_driven(self) -> bool:
+		return self._inotify is not None
+
+	def start(self):
+		with self._lock:
+			if self._thread:
+				return
+			self._ports = enumerate_ports()
+			self._stopping = False
+			if sys.platform.startswith('linux'):
+				try:
+					self._inotify = Inotify(DEV_PATH, IN_CREATE | IN_DELETE | IN_ATTRIB)
+				except (OSError, AttributeError) as e:
+					logging.warning('Port hotplug events are not available, ports are polled: %s', e)
+			self._wake_r, self._wake_w = os.pipe()
+			self._thread = threading.Thread(target=self._run, daemon=True)
+			self._thread.start()
+
+	def stop(self):
+		if self._thread and self._thread is not threading.current_thread():
+			self._stopping = True
+			os.write(self._wake_w, b'\0')
+			self._thread.join()
+			self._thread = None
+			os.close(self._wake_r)
+			os.close(self._wake_w)
+			if self._inotify:
+				self._inotify.close()
+				self._inotify = None
+
+	def ports(self) -> List[PortInfo]:
+		'Gets cached inventory'
+		if not self._thread:
+			self.start()
+		with self._lock:
+			if self._inotify or self._listeners:
+				return list(self._ports)
+		# ports are not polled without listeners
+		return self.refresh()
+
+	def refresh(self) -> List[PortInfo]:
+		'Re-enumerates ports; listeners are called when inventory is changed'
+		ports = enumerate_ports()
+		with self._lock:
+			is_changed = ports != self._ports
+			self._ports = ports
+		if is_changed:
+			self._notify(ports)
+		return ports
+
+	def add_listener(self, listener: Callable):
+		with self._lock:
+			self._listeners.append(listener)
+			if self._thread and not self._inotify and len(self._listeners) == 1:
+				# polling is resumed
+				os.write(self._wake_w, b'\0')
+
+	def remove_listener(self, listener: Callable):
+		with self._lock:
+			if listener in self._listeners:
+				self._listeners.remove(listener)
+
+	def _notify(self, ports: List[PortInfo]):
+		with self._lock:
+			listeners = list(self._listeners)
+		for listener in listeners:
+			try:
+				listener(ports)
+			except Exception as e:
+				logging.warning('port listener failed: %s', e)
+
+	def _wait(self, timeout: Optional[float]) -> bool:
+		'Waits for tty device event; gets False on stop or timeout'
+		fds = [self._wake_r] + ([self._inotify.fd] if self._inotify else [])
+		readable, _, _ = select.select(fds, [], [], timeout)
+		if self._stopping or not readable:
+			return False
+		if not self._inotify:
+			os.read(self._wake_r, 4096)
+			return False
+		names = self._inotify.read_names()
+		return any(name.startswith(TTY_PREFIXES) for name in names)
+
+	def _run(self):
+		logging.info('port watcher thread is started')
+		while not self._stopping:
+			if not self._inotify:
+				if not self._listeners:
+					# nobody waits for port changes: no polling till a listener is added
+					self._wait(None)
+					continue
+				self._wait(self.poll_period)
+				if not self._stopping and self._listeners:
+					self.refresh()
+				continue
+			if not self._wait(None):
+				continue
+			# coalesce the events of the hotplug
+			while self._wait(SETTLE_DELAY):
+				pass
+			if self._stopping:
+				break
+			ports = enumerate_ports()
+			with self._lock:
+				self._ports = ports
+			# node attributes are changed too: port may be openable now even if the inventory is the same
+			self._notify(ports)
+		logging.info('port watcher thread exits')
+
+
+_watcher: Optional[PortWatcher] = None
+_watcher_lock = threading.Lock()
+
+def get_watcher() -> PortWatcher:
+	'Gets process wide port watcher; it is started on first use'
+	global _watcher
+	with _watcher_lock:
+		if _watcher is None:
+			_watcher = PortWatcher()
+		watcher = _watcher
+	watcher.start()
+	return watcher
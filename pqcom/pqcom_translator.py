@@ -1,51 +1,191 @@
+from typing import Optional
 
+import re
+import time
+import codecs
+from itertools import accumulate
+
+from pqcom.tracer import tracer
 
 def from_hex_string(text):
-	return str(bytearray.fromhex(text.replace('\n', ' ')))
+	return bytes.fromhex(text.replace('\n', ' '))
 
 def from_extended_string(text):
 	return text.strip('\n').replace('\\n', '\n').replace('\\r', '\r')
 
-def to_hex_prefix_string(text):
-	result = ''
-	hex_part = ''
-	str_part = ''
-	bytes_index = 0
-	while bytes_index < len(text):
-		ch = text[bytes_index]
-		if ch == '\n':
-			hex_part += '0A' + ' '
-			str_part += '.'
-
-			result += hex_part.ljust(52) + str_part + '\n'
-			hex_part = ''
-			str_part = ''
-		elif ch == '\r':
-			hex_part += '0D' + ' '
-			str_part += '.'
-
-			if ((bytes_index + 1) < len(text)) and (text[bytes_index + 1] == '\n'):
-				hex_part += '0A' + ' '
-				str_part += '.'
-				bytes_index += 1
-
-			result += hex_part.ljust(52) + str_part + '\n'
-			hex_part = ''
-			str_part = ''
+# dump row: up to 16 bytes; line end (CR, LF or CRLF) closes the row unless the row is already full
+HEX_ROW_RE = re.compile(rb'[^\r\n]{16}|[^\r\n]{1,15}(?:\r\n?|\n)?|\r\n?|\n')
+
+# replaces non-printable bytes by dot
+PRINTABLE_TABLE = bytes(c if 0x20 <= c <= 0x7F else ord('.') for c in range(256))
+
+HEX_PART_WIDTH = 52
+
+def to_hex_prefix_string(data):
+	'Formats bytes (or latin-1 text) as rows of HEX & printable parts'
+	span = tracer.begin()
+	if isinstance(data, str):
+		data = data.encode('latin-1')
+	data = bytes(data)
+	hex_all = data.hex(' ').upper()
+	str_all = data.translate(PRINTABLE_TABLE).decode('latin-1')
+	# rows bounds: whole buffer is hexed & translated once, rows are its slices
+	ends = list(accumulate(map(len, HEX_ROW_RE.findall(data))))
+	starts = [0] + ends[:-1]
+	row_format = '%-{}s%s\n'.format(HEX_PART_WIDTH)
+	ret = ''.join([row_format % (hex_all[start * 3:end * 3 - 1], str_all[start:end])
+		for start, end in zip(starts, ends)])
+	tracer.end('translator.hex_dump', span)
+	return ret
+
+class TimestampFormatter(object):
+	'''Formats monotonic timestamps as local time HH:MM:SS.ffffff; seconds part is cached.
+	Clock offset is measured again when the second is changed: wall clock may be stepped by NTP or suspend'''
+
+	def __init__(self):
+		self.sync()
+		self._second = None
+		self._second_text = ''
+
+	def sync(self):
+		'Measures wall clock - monotonic clock offset'
+		self._offset_ns = time.time_ns() - time.monotonic_ns()
+
+	def format(self, timestamp_ns: int) -> str:
+		second, ns = divmod(timestamp_ns + self._offset_ns, 1000000000)
+		if second != self._second:
+			self.sync()
+			second, ns = divmod(timestamp_ns + self._offset_ns, 1000000000)
+			self._second = second
+			self._second_text = time.strftime('%H:%M:%S', time.localtime(second))
+		return '{}.{:06}'.format(self._second_text, ns // 1000)
+
+rx_timestamps = TimestampFormatter()
+
+# RX text of 'bytes' encoding: printable ASCII is kept, backslash & other bytes are escaped as in bytes literals
+BYTES_ENCODING = 'bytes'
+ENCODINGS = (BYTES_ENCODING, 'utf-8', 'latin-1', 'cp1251', 'cp437')
+# bytes of the previous chunks decoded before a chunk rendered alone: incomplete character is completed
+LOOK_BACK = 4
+
+TIME_TIMESTAMPS = 'time' # local time
+ELAPSED_TIMESTAMPS = 'elapsed' # seconds since the first chunk
+NO_TIMESTAMPS = 'none'
+TIMESTAMP_FORMATS = (TIME_TIMESTAMPS, ELAPSED_TIMESTAMPS, NO_TIMESTAMPS)
+
+ESCAPES = {ord('\\'): '\\\\', ord('\t'): '\\t', ord('\n'): '\\n', ord('\r'): '\\r'}
+ESCAPE_TABLE = tuple(ESCAPES.get(c, chr(c) if 0x20 <= c < 0x7F else '\\x{:02x}'.format(c)) for c in range(256))
+# bytes shown as is: chunk without other bytes is decoded with no escaping
+PLAIN_BYTES = bytes(c for c in range(256) if len(ESCAPE_TABLE[c]) == 1)
+# decoded text: control characters are escaped; backslash is kept, undecodable bytes are \xNN
+TEXT_ESCAPE_TABLE = {c: ESCAPE_TABLE[c] for c in list(range(0x20)) + [0x7F]}
+TEXT_CONTROL_RE = re.compile('[\x00-\x1f\x7f]')
+
+def escape_bytes(data) -> str:
+	'Gets chunk as ASCII text escaped by ESCAPE_TABLE'
+	if not data.translate(None, PLAIN_BYTES):
+		return data.decode('ascii')
+	# unicode_escape codec of latin-1 text makes the escapes of the table in one C pass
+	return data.decode('latin-1').encode('unicode_escape').decode('ascii')
+
+def escape_text(text: str) -> str:
+	'Escapes control characters of decoded text'
+	if TEXT_CONTROL_RE.search(text):
+		return text.translate(TEXT_ESCAPE_TABLE)
+	return text
+
+def check_encoding(encoding: str):
+	'Raises LookupError on unknown encoding'
+	if encoding != BYTES_ENCODING:
+		codecs.getincrementaldecoder(encoding)
+
+def rx_prefix(timestamp_ns: int, data) -> str:
+	return rx_timestamps.format(timestamp_ns) + ' {:02} << '.format(len(data))
+
+class RxRenderer(object):
+	'''Formats received chunks as timestamped lines: HEX, escaped bytes or text of the encoding.
+	Incremental decoder of the encoding keeps incomplete multi-byte character till the next chunk,
+	so it is shown in the line of the chunk with the character last byte.
+	render() formats stream of chunks; render_record() formats any chunk alone: view renders lazily.'''
+
+	def __init__(self, encoding: str=BYTES_ENCODING, is_hex=False, timestamps: str=TIME_TIMESTAMPS):
+		if timestamps not in TIMESTAMP_FORMATS:
+			raise ValueError('Wrong timestamp format: ' + timestamps)
+		self.is_hex = is_hex
+		self.timestamps = timestamps
+		self.origin_ns: Optional[int] = None # timestamp of the first chunk: elapsed time origin
+		self._decode = None
+		self.set_encoding(encoding)
+
+	@property
+	def is_decoding(self) -> bool:
+		'Is text of multi-byte capable encoding rendered: chunk start may continue the previous chunk'
+		return not self.is_hex and self.encoding != BYTES_ENCODING
+
+	def set_encoding(self, encoding: str):
+		'Selects text encoding; raises LookupError'
+		check_encoding(encoding)
+		self.encoding = encoding
+		self.reset()
+
+	def set_hex(self, is_hex: bool):
+		if is_hex != self.is_hex:
+			self.is_hex = is_hex
+			self.reset()
+
+	def reset(self):
+		'Drops incomplete character: next chunk is not a continuation'
+		if self.encoding == BYTES_ENCODING:
+			self._decode = None
 		else:
-			hex_part += '{:02X}'.format(ord(ch)) + ' '
-			if ch < '\x20' or ch > '\x7F':
-				ch = '.'
-			str_part += ch
+			self._decode = codecs.getincrementaldecoder(self.encoding)(errors='backslashreplace').decode
 
-		if len(str_part) >= 16:
-			result += hex_part.ljust(52) + str_part + '\n'
-			hex_part = ''
-			str_part = ''
+	def set_timestamps(self, timestamps: str):
+		if timestamps not in TIMESTAMP_FORMATS:
+			raise ValueError('Wrong timestamp format: ' + timestamps)
+		self.timestamps = timestamps
 
-		bytes_index += 1
+	def prefix(self, timestamp_ns: int, data) -> str:
+		if self.timestamps == TIME_TIMESTAMPS:
+			return rx_prefix(timestamp_ns, data)
+		if self.timestamps == ELAPSED_TIMESTAMPS:
+			if self.origin_ns is None:
+				self.origin_ns = timestamp_ns
+			second, ns = divmod(timestamp_ns - self.origin_ns, 1000000000)
+			return '+{}.{:06} {:02} << '.format(second, ns // 1000, len(data))
+		return '{:02} << '.format(len(data))
 
-	if str_part:
-		result += hex_part.ljust(52) + str_part + '\n'
+	def render(self, timestamp_ns: int, data) -> str:
+		start = tracer.begin()
+		if self.is_hex:
+			text = data.hex()
+		elif self._decode:
+			text = escape_text(self._decode(data))
+		else:
+			text = escape_bytes(data)
+		ret = self.prefix(timestamp_ns, data) + text
+		tracer.end('translator.render', start)
+		return ret
+
+	def render_record(self, timestamp_ns: int, data, previous=b'') -> str:
+		'''Formats chunk without the stream decoder: previous is the tail of the previous chunks (LOOK_BACK bytes),
+		it is decoded first, so incomplete character (UTF-8 & other self-synchronizing encodings) is completed'''
+		start = tracer.begin()
+		if self.is_hex:
+			text = data.hex()
+		elif self.encoding == BYTES_ENCODING:
+			text = escape_bytes(data)
+		else:
+			decoder = codecs.getincrementaldecoder(self.encoding)(errors='backslashreplace')
+			if previous:
+				decoder.decode(previous)
+			text = escape_text(decoder.decode(data))
+		ret = self.prefix(timestamp_ns, data) + text
+		tracer.end('translator.render', start)
+		return ret
 
-	return result
+def to_rx_line(data, is_hex=False, timestamp_ns=None):
+	'Formats received chunk as timestamped line of escaped bytes; timestamp is monotonic, ns; default: now'
+	if timestamp_ns is None:
+		timestamp_ns = time.monotonic_ns()
+	return rx_prefix(timestamp_ns, data) + (data.hex() if is_hex else escape_bytes(data))
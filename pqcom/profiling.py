@@ -0,0 +1,92 @@
+'''--profile & --trace session: files are written on exit.
+
+--profile PREFIX writes:
+	PREFIX.prof                        cProfile stats of all threads: python -m pstats PREFIX.prof
+	PREFIX.tracemalloc                 tracemalloc snapshot: tracemalloc.Snapshot.load()
+	PREFIX.trace.json                  span trace of RX/TX hot paths, see pqcom/tracer.py
+--trace FILE writes the span trace only: no profiler overhead.
+'''
+
+from typing import List, Optional
+
+import sys
+import logging
+import threading
+import contextlib
+
+from pqcom.tracer import tracer
+
+
+TRACEMALLOC_FRAMES = 16
+TOP_ALLOCATIONS = 10 # logged on exit
+
+
+class Profiler(object):
+	'cProfile of the calling thread & threads started later, tracemalloc snapshot & span tracer'
+
+	def __init__(self, prefix: str):
+		self.prefix = prefix
+		self._lock = threading.Lock()
+		self._profiles: List = []
+
+	def start(self):
+		# profilers are slow to import: imported on demand
+		import cProfile
+		import tracemalloc
+		tracemalloc.start(TRACEMALLOC_FRAMES)
+		tracer.enable()
+		threading.setprofile(self._start_thread)
+		profile = cProfile.Profile()
+		profile.enable()
+		self._profiles.append(profile)
+
+	def _start_thread(self, frame, event, arg):
+		'The first profile event of new thread: the thread gets its own profile'
+		import cProfile
+		sys.setprofile(None)
+		profile = cProfile.Profile()
+		try:
+			profile.enable()
+		except ValueError:
+			# Python 3.12+: the profile of the main thread sees all threads
+			return
+		with self._lock:
+			self._profiles.append(profile)
+
+	def stop(self):
+		import pstats
+		import tracemalloc
+		threading.setprofile(None)
+		with self._lock:
+			profiles, self._profiles = self._profiles, []
+		for profile in profiles:
+			profile.disable()
+		if profiles:
+			stats = pstats.Stats(*profiles)
+			stats.dump_stats(self.prefix + '.prof')
+		snapshot = tracemalloc.take_snapshot()
+		tracemalloc.stop()
+		snapshot.dump(self.prefix + '.tracemalloc')
+		for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+			logging.info('Memory: %s', stat)
+		tracer.dump(self.prefix + '.trace.json')
+		tracer.disable()
+		logging.info('Profile is written: {0}.prof, {0}.tracemalloc, {0}.trace.json'.format(self.prefix))
+
+
+@contextlib.contextmanager
+def session(profile: Optional[str]=None, trace: Optional[str]=None):
+	'Profiles & traces the block by --profile PREFIX & --trace FILE; files are written on exit'
+	profiler = Profiler(profile) if profile else None
+	if profiler:
+		profiler.start()
+	elif trace:
+		tracer.enable()
+	try:
+		yield
+	finally:
+		if profiler:
+			profiler.stop()
+		if trace:
+			tracer.dump(trace)
+			tracer.disable()
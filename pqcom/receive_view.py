@@ -0,0 +1,369 @@
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import time
+
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QTimer
+from PyQt5.QtGui import QKeySequence
+from PyQt5.QtWidgets import QApplication, QAbstractItemView, QListView
+
+from pqcom.ring_buffer import RingBuffer
+from pqcom.line_search import LineSearch
+from pqcom import pqcom_translator as translator
+from pqcom.tracer import tracer
+
+
+DEFAULT_MAX_LINES = 100000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024 # data of the kept lines: a line is a chunk of up to READ_SIZE_MAX bytes
+# search renders & scans lines by batches up to the time slice per event loop pass:
+# long buffers are searched without freezing GUI
+SEARCH_BATCH = 1000
+SEARCH_TIME_SLICE = 0.02 # s
+RENDER_CACHE_SIZE = 4096 # rendered lines: visible rows are not rendered on each paint
+
+
+def record_size(record: Union[Tuple[int, bytes], str]) -> int:
+	'Gets data size of chunk (timestamp ns, bytes) or notice line'
+	return len(record) if isinstance(record, str) else len(record[1])
+
+
+class ReceiveModel(QAbstractListModel):
+	'''Received chunks (timestamp ns, bytes) & notice lines kept in the ring buffer; oldest items are dropped
+	over max lines or max bytes of the data. Lines of chunks are rendered on demand: renderer is changed
+	without reformatting the history'''
+
+	def __init__(self, max_lines: int=DEFAULT_MAX_LINES, max_bytes: int=DEFAULT_MAX_BYTES, parent=None):
+		super(ReceiveModel, self).__init__(parent)
+		self.renderer = translator.RxRenderer()
+		self.max_bytes = max_bytes
+		self._records = RingBuffer(max_lines)
+		self._bytes = 0 # data size of the records
+		self._first_line = 0 # number of row 0 line: count of lines dropped ever
+		self._cache: Dict[int, str] = {} # line number -> rendered line
+
+	@property
+	def max_lines(self) -> int:
+		return self._records.capacity
+
+	@property
+	def data_size(self) -> int:
+		'Data size of the kept lines'
+		return self._bytes
+
+	@property
+	def first_line(self) -> int:
+		return self._first_line
+
+	@property
+	def end_line(self) -> int:
+		'Number of the next line'
+		return self._first_line + len(self._records)
+
+	def line(self, number: int) -> str:
+		'Gets line by number of LineSearch'
+		line = self._cache.get(number)
+		if line is None:
+			index = number - self._first_line
+			line = self._render(index, self._records[index])
+			if len(self._cache) >= RENDER_CACHE_SIZE:
+				self._cache.clear()
+			self._cache[number] = line
+		return line
+
+	def lines(self, start: int, stop: int) -> List[str]:
+		'Gets lines of numbers start..stop (exclusive) not caching them: search scans all lines once'
+		render = self._render
+		first = self._first_line
+		return [render(index, record) for index, record in enumerate(self._records.slice(start - first, stop - first),
+			start - first)]
+
+	def records(self, start: int, stop: int) -> List[Union[Tuple[int, bytes], str]]:
+		'Gets chunks (timestamp ns, bytes) & notice lines of numbers start..stop (exclusive): bytes search'
+		first = self._first_line
+		return self._records.slice(start - first, stop - first)
+
+	def _render(self, index: int, record) -> str:
+		if isinstance(record, str):
+			return record
+		return self.renderer.render_record(record[0], record[1], self._look_back(index))
+
+	def _look_back(self, index: int) -> bytes:
+		'Gets tail of the chunks before the index: incomplete character of the chunk start is decoded'
+		if not self.renderer.is_decoding:
+			return b''
+		tail = b''
+		while index > 0 and len(tail) < translator.LOOK_BACK:
+			index -= 1
+			record = self._records[index]
+			if isinstance(record, str):
+				break
+			tail = record[1][-translator.LOOK_BACK:] + tail
+		return tail[-translator.LOOK_BACK:]
+
+	def set_max_lines(self, max_lines: int):
+		self.beginResetModel()
+		count = len(self._records)
+		self._records.resize(max_lines)
+		self._first_line += count - len(self._records)
+		self._bytes = sum(map(record_size, self._records))
+		self.endResetModel()
+
+	def set_max_bytes(self, max_bytes: int):
+		self.max_bytes = max_bytes
+		drop = self._over_budget(0, 0)
+		if drop:
+			self.beginRemoveRows(QModelIndex(), 0, drop - 1)
+			self._discard(drop)
+			self.endRemoveRows()
+
+	def _over_budget(self, new_bytes: int, first: int) -> int:
+		'Gets count of the oldest records to drop: the first ones are dropped anyway, max bytes are kept'
+		drop = first
+		total = self._bytes + new_bytes - sum(map(record_size, self._records.slice(0, drop)))
+		while total > self.max_bytes and drop < len(self._records):
+			total -= record_size(self._records[drop])
+			drop += 1
+		return drop
+
+	def _discard(self, count: int):
+		self._bytes -= sum(map(record_size, self._records.slice(0, count)))
+		self._records.discard(count)
+		self._first_line += count
+
+	def rowCount(self, parent=QModelIndex()):
+		return 0 if parent.isValid() else len(self._records)
+
+	def data(self, index, role=Qt.DisplayRole):
+		if role == Qt.DisplayRole and index.isValid():
+			return self.line(self._first_line + index.row())
+		return None
+
+	def append_records(self, records: Iterable[Union[Tuple[int, bytes], str]]):
+		'Appends chunks (timestamp ns, bytes) or notice lines'
+		records = list(records)[-self._records.capacity:]
+		if not records:
+			return
+		sizes = list(map(record_size, records))
+		new_bytes = sum(sizes)
+		skip = 0
+		while new_bytes > self.max_bytes and skip < len(records) - 1:
+			# the newest records are kept even over max bytes: the last one at least
+			new_bytes -= sizes[skip]
+			skip += 1
+		if skip:
+			records = records[skip:]
+		if self.renderer.origin_ns is None and not isinstance(records[0], str):
+			self.renderer.origin_ns = records[0][0]
+		drop = self._over_budget(new_bytes, max(0, len(self._records) + len(records) - self._records.capacity))
+		if drop > 0:
+			self.beginRemoveRows(QModelIndex(), 0, drop - 1)
+			self._discard(drop)
+			self.endRemoveRows()
+		first = len(self._records)
+		self.beginInsertRows(QModelIndex(), first, first + len(records) - 1)
+		self._records.extend(records)
+		self._bytes += new_bytes
+		self.endInsertRows()
+
+	def invalidate(self):
+		'''Drops rendered lines after renderer change; views are to be repainted: visible rows only are rendered again.
+		dataChanged() of all rows is not emitted: list view lays out all rows on it'''
+		self._cache.clear()
+
+	def clear(self):
+		self.beginResetModel()
+		self._first_line += len(self._records)
+		self._records.clear()
+		self._bytes = 0
+		self._cache.clear()
+		self.renderer.origin_ns = None
+		self.endResetModel()
+
+
+class FilterModel(QAbstractListModel):
+	'Lines of ReceiveModel matching LineSearch: rows refer to the source lines, lines are not copied'
+
+	def __init__(self, source: ReceiveModel, parent=None):
+		super(FilterModel, self).__init__(parent)
+		self._source = source
+		self._search: Optional[LineSearch] = None
+		source.rowsRemoved.connect(self._discard)
+		source.modelReset.connect(self._discard)
+
+	@property
+	def search(self) -> Optional[LineSearch]:
+		return self._search
+
+	def set_search(self, search: Optional[LineSearch]):
+		self.beginResetModel()
+		self._search = search
+		self.endResetModel()
+
+	def rowCount(self, parent=QModelIndex()):
+		return 0 if parent.isValid() or self._search is None else len(self._search)
+
+	def data(self, index, role=Qt.DisplayRole):
+		if role == Qt.DisplayRole and index.isValid():
+			return self._source.line(self._search[index.row()])
+		return None
+
+	def source_row(self, row: int) -> int:
+		return self._search[row] - self._source.first_line
+
+	def _discard(self, *args):
+		'Drops rows of the dropped source lines'
+		if self._search is not None:
+			count = self._search.count_before(self._source.first_line)
+			if count:
+				self.beginRemoveRows(QModelIndex(), 0, count - 1)
+				self._search.discard_before(self._source.first_line)
+				self.endRemoveRows()
+
+	def update(self, limit: int=SEARCH_BATCH) -> bool:
+		'Scans up to limit of new source lines; returns True when all lines are scanned'
+		source = self._source
+		if self._search is None:
+			return True
+		lines = source.records if self._search.is_bytes else source.lines
+		matches = self._search.scan(lines, source.first_line, source.end_line, limit)
+		if matches:
+			row = len(self._search)
+			self.beginInsertRows(QModelIndex(), row, row + len(matches) - 1)
+			self._search.extend(matches)
+			self.endInsertRows()
+		return self._search.scanned >= source.end_line
+
+
+class ReceiveView(QListView):
+	'Virtualized view of received lines: only visible rows are rendered'
+
+	def __init__(self, parent=None):
+		super(ReceiveView, self).__init__(parent)
+		self._source = ReceiveModel(parent=self)
+		self._filter = FilterModel(self._source, self)
+		self.setModel(self._source)
+		self.setUniformItemSizes(True)
+		self.setSelectionMode(QAbstractItemView.ExtendedSelection)
+		self.setEditTriggers(QAbstractItemView.NoEditTriggers)
+		self._search_timer = QTimer(self)
+		self._search_timer.setInterval(0)
+		self._search_timer.timeout.connect(self._scan)
+
+	@property
+	def max_lines(self) -> int:
+		return self._source.max_lines
+
+	@property
+	def renderer(self) -> translator.RxRenderer:
+		return self._source.renderer
+
+	@property
+	def is_filtered(self) -> bool:
+		return self.model() is self._filter
+
+	@property
+	def match_count(self) -> int:
+		'Count of matching lines found so far'
+		return self._filter.rowCount()
+
+	def set_max_lines(self, max_lines: int):
+		self._source.set_max_lines(max_lines)
+
+	def set_max_bytes(self, max_bytes: int):
+		self._source.set_max_bytes(max_bytes)
+
+	def append_records(self, records: Iterable[Tuple[int, bytes]]):
+		'Appends received chunks (timestamp ns, bytes)'
+		self._source.append_records(records)
+		if self._filter.search is not None:
+			self._search_timer.start()
+		if not self.is_filtered:
+			self.scrollToBottom()
+
+	def append_lines(self, lines: Iterable[str]):
+		'Appends notice lines'
+		self.append_records(lines)
+
+	def clear(self):
+		self._source.clear()
+
+	def set_hex(self, is_hex: bool):
+		self.renderer.set_hex(is_hex)
+		self.rerender()
+
+	def set_encoding(self, encoding: str):
+		'Raises LookupError'
+		self.renderer.set_encoding(encoding)
+		self.rerender()
+
+	def set_timestamps(self, timestamps: str):
+		self.renderer.set_timestamps(timestamps)
+		self.rerender()
+
+	def rerender(self):
+		'Shows lines by the changed renderer; text search is restarted as the text is changed'
+		self._source.invalidate()
+		search = self._filter.search
+		if search is not None and not search.is_bytes:
+			self._filter.set_search(LineSearch(search.pattern, search.is_regex))
+			self._search_timer.start()
+		self.viewport().update()
+
+	def set_search(self, pattern: str, is_regex=True, is_bytes=False):
+		'Starts incremental search of lines text or received bytes; empty pattern stops it; raises re.error'
+		self._filter.set_search(LineSearch(pattern, is_regex, is_bytes=is_bytes) if pattern else None)
+		if pattern:
+			self._search_timer.start()
+
+	def set_filter(self, is_true: bool):
+		'Shows only lines matching the search'
+		self.setModel(self._filter if is_true else self._source)
+		self.scrollToBottom()
+
+	def find(self, backward=False) -> bool:
+		'Selects next/previous line of the matches found so far from the current line; wraps around'
+		search = self._filter.search
+		count = len(search) if search is not None else 0
+		if not count:
+			return False
+		current = self.currentIndex().row() if self.currentIndex().isValid() else -1
+		if current < 0:
+			row = count - 1 if backward else 0
+		elif self.is_filtered:
+			row = current - 1 if backward else current + 1
+		else:
+			line = self._source.first_line + current
+			row = search.count_before(line) - 1 if backward else search.count_before(line + 1)
+		row %= count
+		if not self.is_filtered:
+			row = self._filter.source_row(row)
+		index = self.model().index(row)
+		self.setCurrentIndex(index)
+		self.scrollTo(index, QAbstractItemView.PositionAtCenter)
+		return True
+
+	def _scan(self):
+		start = tracer.begin()
+		rows = self._filter.rowCount()
+		deadline = time.monotonic() + SEARCH_TIME_SLICE
+		while True:
+			if self._filter.update():
+				self._search_timer.stop()
+				break
+			if time.monotonic() >= deadline:
+				break
+		if self.is_filtered and self._filter.rowCount() > rows:
+			self.scrollToBottom()
+		tracer.end('view.search', start)
+
+	def copy(self):
+		'Copies selected lines to clipboard'
+		rows = sorted(i.row() for i in self.selectedIndexes())
+		if rows:
+			model = self.model()
+			QApplication.clipboard().setText('\n'.join(model.data(model.index(r)) for r in rows))
+
+	def keyPressEvent(self, event):
+		if event.matches(QKeySequence.Copy):
+			self.copy()
+		else:
+			super(ReceiveView, self).keyPressEvent(event)
@@ -0,0 +1,144 @@
+from typing import Optional
+
+import math
+import time
+import threading
+import logging
+
+from pqcom import serial_bus
+
+
+# last part of the wait till the deadline is spun instead of slept: sleep granularity is too coarse
+SPIN_THRESHOLD = 0.001 # s
+# when the sender is late more than this, missed ticks are skipped instead of sent back to back
+MAX_LATENESS = 1.0 # s
+
+
+class RepeaterStats(object):
+	'Requested & achieved rate, deadline lateness (jitter) of the periodic sender'
+
+	def __init__(self, period: float=1, burst: int=1):
+		self.period = period
+		self.burst = burst
+		self.ticks = 0
+		self.skipped = 0
+		self.frames = 0 # accepted by TX queue
+		self.dropped = 0 # frames dropped by TX queue policy
+		self._first_frames = 0 # frames of the first tick: the rate is counted since it
+		self.elapsed = 0.0 # s, from the first tick to the last one
+		self.lateness_max = 0.0
+		self._lateness_mean = 0.0
+		self._lateness_m2 = 0.0
+
+	def add_tick(self, lateness: float, frames: int, dropped: int=0):
+		# Welford's running mean & variance
+		self.ticks += 1
+		self.frames += frames
+		self.dropped += dropped
+		if self.ticks == 1:
+			self._first_frames = frames
+		delta = lateness - self._lateness_mean
+		self._lateness_mean += delta / self.ticks
+		self._lateness_m2 += delta * (lateness - self._lateness_mean)
+		if lateness > self.lateness_max:
+			self.lateness_max = lateness
+
+	@property
+	def requested_rate(self) -> float:
+		'Frames/s'
+		return self.burst / self.period
+
+	@property
+	def achieved_rate(self) -> float:
+		'Frames/s: frames queued after the first tick over the time since it'
+		return (self.frames - self._first_frames) / self.elapsed if self.elapsed > 0 else 0.0
+
+	@property
+	def jitter(self) -> float:
+		'Standard deviation of the tick lateness, s'
+		return math.sqrt(self._lateness_m2 / self.ticks) if self.ticks > 1 else 0.0
+
+	@property
+	def lateness_mean(self) -> float:
+		return self._lateness_mean
+
+	def __str__(self) -> str:
+		return 'rate {:.1f}/{:.1f} frames/s, dropped {}, jitter {:.0f} us, late mean {:.0f} max {:.0f} us, skipped {}'.format(
+			self.achieved_rate, self.requested_rate, self.dropped, self.jitter * 1e6,
+			self.lateness_mean * 1e6, self.lateness_max * 1e6, self.skipped)
+
+
+class Repeater(object):
+	'Periodic sender: ticks are scheduled by perf_counter deadlines, so the average rate does not drift'
+
+	def __init__(self, bus: serial_bus.SerialBus):
+		self.bus = bus
+		self.stop_event = threading.Event()
+		self.period = 1
+		self.burst = 1
+		self.thread: Optional[threading.Thread] = None
+		self.stats = RepeaterStats()
+
+	@property
+	def is_running(self) -> bool:
+		return self.thread is not None and self.thread.is_alive()
+
+	def set_period(self, period):
+		self.period = period
+
+	def start(self, data, period, burst=1):
+		'Sends data burst times each period, s'
+		self.stop()
+		# each thread has its own event: a stopped thread may still wait in a blocked TX queue
+		self.stop_event = threading.Event()
+		self.period = period
+		self.burst = burst
+		self.stats = RepeaterStats(period, burst)
+		self.thread = threading.Thread(target=self.repeat, args=(data, self.stop_event), daemon=True)
+		self.thread.start()
+
+	def stop(self):
+		'''Stops the sender without join: write to full TX queue of block policy waits up to its timeout,
+		the thread exits after it'''
+		self.stop_event.set()
+		self.thread = None
+
+	def _wait(self, deadline: float, stop_event: threading.Event) -> bool:
+		'Waits till the deadline; gets False when stopped'
+		delay = deadline - time.perf_counter() - SPIN_THRESHOLD
+		if delay > 0 and stop_event.wait(delay):
+			return False
+		while time.perf_counter() < deadline:
+			time.sleep(0) # yields GIL
+		return not stop_event.is_set()
+
+	def repeat(self, data, stop_event: threading.Event):
+		logging.info('repeater thread is started')
+		stats = self.stats
+		period = self.period
+		burst = self.burst
+		write = self.bus.write
+		start = deadline = time.perf_counter()
+		while True:
+			now = time.perf_counter()
+			lateness = now - deadline
+			if lateness > MAX_LATENESS:
+				# resynchronize: skip the missed ticks
+				missed = int(lateness / period)
+				stats.skipped += missed
+				deadline += missed * period
+				lateness -= missed * period
+			frames = dropped = 0
+			for _ in range(burst):
+				if stop_event.is_set():
+					break
+				if write(data):
+					frames += 1
+				else:
+					dropped += 1
+			stats.add_tick(lateness, frames, dropped)
+			stats.elapsed = now - start
+			deadline += period
+			if not self._wait(deadline, stop_event):
+				break
+		logging.info('repeater thread exits: %s', stats)
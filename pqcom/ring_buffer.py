@@ -0,0 +1,82 @@
+from typing import Any, Iterable, List
+
+
+class RingBuffer(object):
+	'Fixed capacity FIFO with O(1) append and O(1) random access; oldest items are dropped'
+
+	def __init__(self, capacity: int):
+		if capacity <= 0:
+			raise ValueError('Ring buffer capacity must be positive')
+		self._capacity = capacity
+		self._items: List[Any] = [None] * capacity
+		self._head = 0 # index of the oldest item
+		self._count = 0
+
+	@property
+	def capacity(self) -> int:
+		return self._capacity
+
+	def __len__(self) -> int:
+		return self._count
+
+	def __getitem__(self, index: int) -> Any:
+		if index < 0:
+			index += self._count
+		if index < 0 or index >= self._count:
+			raise IndexError('Ring buffer index out of range')
+		return self._items[(self._head + index) % self._capacity]
+
+	def __iter__(self):
+		for i in range(self._count):
+			yield self._items[(self._head + i) % self._capacity]
+
+	def slice(self, start: int, stop: int) -> List[Any]:
+		'Gets items [start, stop) by at most two list slices'
+		start = max(0, start)
+		stop = min(self._count, stop)
+		if start >= stop:
+			return []
+		first = (self._head + start) % self._capacity
+		last = first + stop - start
+		if last <= self._capacity:
+			return self._items[first:last]
+		return self._items[first:] + self._items[:last - self._capacity]
+
+	def append(self, item: Any) -> int:
+		'Appends item; returns count of dropped oldest items (0 or 1)'
+		if self._count < self._capacity:
+			self._items[(self._head + self._count) % self._capacity] = item
+			self._count += 1
+			return 0
+		self._items[self._head] = item
+		self._head = (self._head + 1) % self._capacity
+		return 1
+
+	def extend(self, items: Iterable[Any]) -> int:
+		'Appends items; returns count of dropped oldest items'
+		dropped = 0
+		for item in items:
+			dropped += self.append(item)
+		return dropped
+
+	def discard(self, count: int):
+		'Drops count of oldest items'
+		count = min(count, self._count)
+		for i in range(count):
+			self._items[(self._head + i) % self._capacity] = None
+		self._head = (self._head + count) % self._capacity
+		self._count -= count
+
+	def clear(self):
+		self._items = [None] * self._capacity
+		self._head = 0
+		self._count = 0
+
+	def resize(self, capacity: int):
+		'Changes capacity keeping the newest items'
+		if capacity <= 0:
+			raise ValueError('Ring buffer capacity must be positive')
+		items = list(self)[-capacity:]
+		self._capacity = capacity
+		self.clear()
+		self.extend(items)
@@ -0,0 +1,245 @@
+'''Scripted send sequences with RX response matching.
+
+Script: a step per line; # comments:
+	send TEXT           sends extended text: \\n and \\r escapes
+	hex HEX             sends HEX bytes: 01 02 ff
+	expect SEC REGEX    waits up to SEC for REGEX (Python re, bytes) in RX
+	delay SEC           sleeps
+	loop COUNT          repeats the steps till end COUNT times; 0 - forever
+	end
+'''
+
+from typing import Callable, List, Optional
+
+import re
+import time
+import threading
+import logging
+
+from pqcom import serial_bus
+from pqcom import pqcom_translator as translator
+
+
+# longest expected match: older RX data are dropped while waiting
+DEFAULT_MAX_MATCH = 4096
+WAIT_STEP = 0.1 # s; stop is checked while waiting
+
+
+class SequenceError(Exception):
+	pass
+
+
+class RxMatcher(object):
+	'''Incremental matching over RX stream: new data are scanned only
+	(plus the tail of max match length, for matches crossing chunks).
+	Buffer keeps up to limit bytes: the longest match of the script'''
+
+	def __init__(self, limit: int=DEFAULT_MAX_MATCH):
+		self.limit = limit
+		self._buffer = bytearray()
+		self._scanned = 0
+		self._condition = threading.Condition()
+
+	def feed(self, data):
+		with self._condition:
+			self._buffer += data
+			excess = len(self._buffer) - self.limit
+			if excess > 0:
+				# no expect is waiting (send, delay or no expect steps): older data can not be a part of a match
+				del self._buffer[:excess]
+				self._scanned = max(0, self._scanned - excess)
+			self._condition.notify_all()
+
+	def clear(self):
+		with self._condition:
+			self._buffer.clear()
+			self._scanned = 0
+
+	def expect(self, regex, timeout: float, max_match: int=DEFAULT_MAX_MATCH,
+			stop_event: Optional[threading.Event]=None) -> bytes:
+		'Waits for regex; RX data are consumed till the match end; gets the match'
+		deadline = time.monotonic() + timeout
+		with self._condition:
+			while True:
+				m = regex.search(self._buffer, max(0, self._scanned - max_match + 1))
+				if m:
+					ret = bytes(m.group(0))
+					del self._buffer[:m.end()]
+					self._scanned = 0
+					return ret
+				self._scanned = len(self._buffer)
+				excess = self._scanned - max_match
+				if excess > 0:
+					# the data can not be a part of a match
+					del self._buffer[:excess]
+					self._scanned -= excess
+				left = deadline - time.monotonic()
+				if left <= 0:
+					raise SequenceError('Timeout of expect: {!r}'.format(regex.pattern))
+				if stop_event and stop_event.is_set():
+					raise SequenceError('Stopped')
+				self._condition.wait(min(left, WAIT_STEP))
+
+
+class Step(object):
+	def run(self, runner: 'SequenceRunner'):
+		raise NotImplementedError
+
+class SendStep(Step):
+	def __init__(self, data: bytes):
+		self.data = data
+
+	def run(self, runner):
+		if not runner.bus.write(self.data):
+			# full TX queue: the next expect would fail by timeout
+			raise SequenceError('Send dropped by full TX queue: {!r}'.format(self.data))
+
+	def __str__(self):
+		return 'send {!r}'.format(self.data)
+
+class ExpectStep(Step):
+	def __init__(self, pattern: bytes, timeout: float, max_match: int=DEFAULT_MAX_MATCH):
+		self.regex = re.compile(pattern)
+		self.timeout = timeout
+		self.max_match = max_match
+
+	def run(self, runner):
+		runner.matched = runner.matcher.expect(self.regex, self.timeout, self.max_match, runner.stop_event)
+
+	def __str__(self):
+		return 'expect {!r}'.format(self.regex.pattern)
+
+class DelayStep(Step):
+	def __init__(self, seconds: float):
+		self.seconds = seconds
+
+	def run(self, runner):
+		if runner.stop_event.wait(self.seconds):
+			raise SequenceError('Stopped')
+
+	def __str__(self):
+		return 'delay {}'.format(self.seconds)
+
+class LoopStep(Step):
+	def __init__(self, steps: List[Step], count: int=0):
+		self.steps = steps
+		self.count = count
+
+	def run(self, runner):
+		i = 0
+		while not self.count or i < self.count:
+			for step in self.steps:
+				runner.run_step(step)
+			i += 1
+
+	def __str__(self):
+		return 'loop {}'.format(self.count)
+
+
+def max_match(steps: List[Step]) -> int:
+	'Gets the longest match of expect steps'
+	ret = 0
+	for step in steps:
+		if isinstance(step, ExpectStep):
+			ret = max(ret, step.max_match)
+		elif isinstance(step, LoopStep):
+			ret = max(ret, max_match(step.steps))
+	return ret
+
+def parse_script(text: str) -> List[Step]:
+	'Gets steps from script text'
+	root: List[Step] = []
+	stack = [root]
+	for line_number, line in enumerate(text.splitlines(), 1):
+		line = line.strip()
+		if not line or line.startswith('#'):
+			continue
+		command, _, argument = line.partition(' ')
+		try:
+			if command == 'send':
+				stack[-1].append(SendStep(translator.from_extended_string(argument).encode()))
+			elif command == 'hex':
+				stack[-1].append(SendStep(translator.from_hex_string(argument)))
+			elif command == 'expect':
+				timeout, _, pattern = argument.strip().partition(' ')
+				stack[-1].append(ExpectStep(pattern.encode(), float(timeout)))
+			elif command == 'delay':
+				stack[-1].append(DelayStep(float(argument)))
+			elif command == 'loop':
+				loop = LoopStep([], int(argument or 0))
+				stack[-1].append(loop)
+				stack.append(loop.steps)
+			elif command == 'end' and len(stack) > 1:
+				stack.pop()
+			else:
+				raise ValueError('unknown command: ' + command)
+		except (ValueError, re.error) as e:
+			raise SequenceError('Line {}: {}'.format(line_number, e))
+	if len(stack) > 1:
+		raise SequenceError('Loop without end')
+	return root
+
+def load_script(path: str) -> List[Step]:
+	with open(path) as f:
+		return parse_script(f.read())
+
+
+class SequenceRunner(object):
+	'Runs steps against SerialBus in worker thread'
+
+	def __init__(self, bus: serial_bus.SerialBus,
+			on_finished: Optional[Callable]=None, on_step: Optional[Callable]=None):
+		self.bus = bus
+		self.finished = on_finished # on_finished(ok: bool, message: str)
+		self.step = on_step # on_step(step: Step)
+		self.matcher = RxMatcher()
+		self.matched = b''
+		self.stop_event = threading.Event()
+		self.thread: Optional[threading.Thread] = None
+
+	@property
+	def is_running(self) -> bool:
+		return self.thread is not None and self.thread.is_alive()
+
+	def start(self, steps: List[Step]):
+		self.stop()
+		self.stop_event.clear()
+		self.thread = threading.Thread(target=self.run, args=(steps,))
+		self.thread.start()
+
+	def stop(self):
+		self.stop_event.set()
+		if self.thread and self.thread is not threading.current_thread():
+			self.thread.join()
+		self.thread = None
+
+	def _on_chunk(self, bus, direction: int, timestamp_ns: int, data):
+		if direction == serial_bus.RX:
+			self.matcher.feed(data)
+
+	def run_step(self, step: Step):
+		if self.stop_event.is_set():
+			raise SequenceError('Stopped')
+		if self.step:
+			self.step(step)
+		step.run(self)
+
+	def run(self, steps: List[Step]) -> bool:
+		'Runs steps; gets True when all steps are passed'
+		logging.info('sequence thread is started')
+		self.matcher.clear()
+		self.matcher.limit = max_match(steps) or DEFAULT_MAX_MATCH
+		self.bus.add_listener(self._on_chunk)
+		start = time.monotonic()
+		try:
+			for step in steps:
+				self.run_step(step)
+			ok, message = True, 'Passed in {:.3f} s'.format(time.monotonic() - start)
+		except SequenceError as e:
+			ok, message = False, 'Failed: {}'.format(e)
+		finally:
+			self.bus.remove_listener(self._on_chunk)
+		logging.info('sequence thread exits: %s', message)
+		if self.finished:
+			self.finished(ok, message)
+		return ok
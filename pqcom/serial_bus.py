@@ -1,19 +1,26 @@
 
-from typing import Iterable, Optional, Callable
+from typing import Iterable, List, Optional, Callable, Tuple
 
 import sys
+import time
 import queue
 
 import threading
 import logging
 
 import serial
-from serial.tools import list_ports
 
 import re
 
+from pqcom import port_watcher
+from pqcom import byte_queue
+from pqcom import io_stats
+from pqcom.tracer import tracer
+
 
 VID_PID = Iterable[int]
+# received chunk: monotonic timestamp ns of the read & data
+RX_RECORD = Tuple[int, bytes]
 
 BYTE_SIZE_DICT = {5: serial.FIVEBITS, 6: serial.SIXBITS, 7: serial.SEVENBITS, 8: serial.EIGHTBITS}
 
@@ -27,8 +34,26 @@ PORT_NAME_FILTER = ['ACM', 'USB', 'COM', 'cu.']
 
 DEFAULT_TIMEOUT = 0.2
 
+# listener's chunk direction
+RX = 0
+TX = 1
+
+# RX chunk: about 10 ms of line data, see SerialParameters.get_read_size()
+READ_SIZE_MIN = 64
+READ_SIZE_MAX = 64 * 1024
+# RX line idle gap: about 4 chars, see SerialParameters.get_inter_byte_timeout()
+INTER_BYTE_TIMEOUT_MIN = 0.001
+INTER_BYTE_TIMEOUT_MAX = 0.05
+
+# max bytes joined into one write when TX queue is backed up
+TX_COALESCE_LIMIT = 64 * 1024
+
+# queue limits, bytes: stalled consumer does not grow memory without limit
+RX_QUEUE_LIMIT = 64 * 1024 * 1024
+TX_QUEUE_LIMIT = 4 * 1024 * 1024
+
 def get_ports() -> Iterable[str]:
-	'''Gets list of names of available com ports'''
+	'''Gets list of names of available com ports from the port watcher inventory'''
 
 	def port_name_filter(port_name: str) -> bool:
 		for _ in PORT_NAME_FILTER:
@@ -36,12 +61,12 @@ def get_ports() -> Iterable[str]:
 				return True
 		return False
 
-	ret = [ p.device for p in list_ports.comports() if port_name_filter(p.name) ]
+	ret = [ p.device for p in port_watcher.get_watcher().ports() if port_name_filter(p.name) ]
 	ret.sort()
 	return ret
 
 def find_port_by_vidpid_list(vidpid: Iterable[VID_PID]) -> Optional[str]:
-	for p in list_ports.comports():
+	for p in port_watcher.get_watcher().ports():
 		for vid_pid in vidpid:
 			if vid_pid[0] == p.vid and vid_pid[1] == p.pid:
 				return p.device
@@ -49,11 +74,14 @@ def find_port_by_vidpid_list(vidpid: Iterable[VID_PID]) -> Optional[str]:
 
 class SerialParameters():
 
-	def __init__(self, baud=115200, bytesize=8, stopbits='1', parity='N'):
+	def __init__(self, baud=115200, bytesize=8, stopbits='1', parity='N',
+			read_size: Optional[int]=None, inter_byte_timeout: Optional[float]=None):
 		self.set_baud(baud)
 		self.set_bytesize(bytesize)
 		self.set_stopbits(stopbits)
 		self.set_parity(parity)
+		self.read_size = read_size
+		self.inter_byte_timeout = inter_byte_timeout
 
 	def set(self, parameters: str):
 		'Sets parameters from string, example: 115200 8N1'
@@ -63,7 +91,6 @@ class SerialParameters():
 		self.set_baud(int(m.group(1)))
 		self.set_bytesize(int(m.group(2)))
 		self.set_parity(m.group(3))
-		print(m.group(4))
 		self.set_stopbits(m.group(4))
 
 	def set_baud(self, baud: int):
@@ -78,6 +105,18 @@ class SerialParameters():
 	def set_parity(self, parity: str):
 		self.parity = PARITY_DICT[parity.upper()]
 
+	def get_read_size(self) -> int:
+		'Gets RX chunk size, bytes: overridden or derived from baud'
+		if self.read_size:
+			return self.read_size
+		return min(READ_SIZE_MAX, max(READ_SIZE_MIN, self.baud // 1000))
+
+	def get_inter_byte_timeout(self) -> float:
+		'Gets RX idle gap which ends a chunk, s: overridden or derived from baud'
+		if self.inter_byte_timeout:
+			return self.inter_byte_timeout
+		return min(INTER_BYTE_TIMEOUT_MAX, max(INTER_BYTE_TIMEOUT_MIN, 40.0 / self.baud))
+
 	def __str__(self) -> str:
 		return '{} {}{}{}'.format(self.baud, self.bytesize, self.parity, self.stopbits)
 
@@ -94,17 +133,27 @@ class SerialParameters():
 
 
 class SerialBus(object):
-	'Multithreaded & queued com port RX/TX'
+	'Multithreaded & queued com port RX/TX; or RX/TX by shared I/O engine, see serial_selector'
 
-	def __init__(self, on_received: Optional[Callable]=None, on_failed: Optional[Callable]=None):
+	def __init__(self, on_received: Optional[Callable]=None, on_failed: Optional[Callable]=None, engine=None):
 		self.notify = on_received
 		self.fail = on_failed
+		self.engine = engine
+		# called from I/O thread for each chunk: listener(bus, direction, timestamp_ns, data)
+		self.listeners: List[Callable] = []
 
 		self._is_open = False
-
-		self.tx_queue = queue.Queue()
-		self.rx_queue = queue.Queue()
+		self.counters = io_stats.IoCounters()
+
+		self.tx_queue = byte_queue.ByteQueue(TX_QUEUE_LIMIT, byte_queue.BLOCK)
+		self.rx_queue = byte_queue.ByteQueue(RX_QUEUE_LIMIT, byte_queue.DROP_OLDEST, size=lambda record: len(record[1]))
+		# set by RX thread when notification is sent, cleared by read_all();
+		# keeps at most one notification pending regardless of RX rate
+		self._notify_pending = False
+		self.notified_ns = 0 # tracer clock of the last notification: Qt signal hop span
 		self.serial = None
+		self.read_size = READ_SIZE_MIN
+		self.inter_byte_timeout = INTER_BYTE_TIMEOUT_MIN
 		self.tx_thread = None
 		self.rx_thread = None
 
@@ -126,6 +175,28 @@ class SerialBus(object):
 			return ret
 		return ''
 
+	def set_queue_limits(self, rx_limit: int=RX_QUEUE_LIMIT, rx_policy: str=byte_queue.DROP_OLDEST,
+			tx_limit: int=TX_QUEUE_LIMIT, tx_policy: str=byte_queue.BLOCK, spill=None):
+		'''Sets queue limits, bytes (0 - unbounded) & overflow policies, see byte_queue;
+		spill: CaptureWriter of RX chunks evicted by SPILL policy'''
+		if tx_policy == byte_queue.SPILL:
+			raise ValueError('TX queue can not spill')
+		if rx_policy == byte_queue.BLOCK and self.engine:
+			raise ValueError('RX queue of shared I/O engine can not block')
+		spill_record = None
+		if spill:
+			spill_record = lambda record: spill.write(RX, self.port, record[1], record[0])
+		self.rx_queue = byte_queue.ByteQueue(rx_limit, rx_policy, size=lambda record: len(record[1]), spill=spill_record)
+		self.tx_queue = byte_queue.ByteQueue(tx_limit, tx_policy)
+
+	def queue_stats(self) -> Tuple[byte_queue.QueueStats, byte_queue.QueueStats]:
+		'Gets RX & TX queue counters'
+		return self.rx_queue.stats, self.tx_queue.stats
+
+	def create_sampler(self) -> io_stats.StatsSampler:
+		'Gets sampler of I/O counters: rates, queue depths, read sizes, reconnects, errors & drain lag'
+		return io_stats.StatsSampler(self)
+
 	def start(self, parameters: SerialParameters,
 			port_name: Optional[str]=None, vid_pid: Optional[Iterable[VID_PID]]=None):
 		'Starts for RX/TX'
@@ -153,23 +224,35 @@ class SerialBus(object):
 				stopbits=parameters.stopbits,
 				parity=parameters.parity,
 				timeout=DEFAULT_TIMEOUT)
-			self.tx_queue.queue.clear()
-			self.rx_queue.queue.clear()
+			self.read_size = parameters.get_read_size()
+			self.inter_byte_timeout = parameters.get_inter_byte_timeout()
+			self.tx_queue.clear()
+			self.rx_queue.clear()
+			self._notify_pending = False
 			self.stop_event.set()
-			self.tx_thread = threading.Thread(target=self._send)
-			self.rx_thread = threading.Thread(target=self._recv)
-			self.stop_event.clear()
-			self.tx_thread.start()
-			self.rx_thread.start()
-			self._is_open = True
+			if self.engine:
+				self.stop_event.clear()
+				self._is_open = True
+				self.engine.add(self)
+			else:
+				self.tx_thread = threading.Thread(target=self._send)
+				self.rx_thread = threading.Thread(target=self._recv)
+				self.stop_event.clear()
+				self.tx_thread.start()
+				self.rx_thread.start()
+				self._is_open = True
+			self.counters.opens += 1
 		except IOError as e:
 			logging.warning(e)
+			self.counters.failed(e, False)
 			self._is_open = False
 			if self.fail:
 				self.fail()
 
 	def join(self):
 		self.stop_event.set()
+		if self.engine:
+			self.engine.remove(self)
 		if self.tx_thread:
 			self.tx_thread.join()
 			self.rx_thread.join()
@@ -178,50 +261,136 @@ class SerialBus(object):
 			self.serial.close()
 		self._is_open = False
 
-	def write(self, data):
-		self.tx_queue.put(data)
+	def write(self, data) -> bool:
+		'''Queues bytes-like data (bytes, bytearray, memoryview) to TX; text is encoded once here.
+		Returns False if data are dropped by the TX queue policy'''
+		if isinstance(data, str):
+			data = data.encode()
+		ret = self.tx_queue.put(data)
+		if self.engine and self._is_open:
+			self.engine.want_write(self)
+		return ret
+
+	def add_listener(self, listener: Callable):
+		self.listeners.append(listener)
+
+	def remove_listener(self, listener: Callable):
+		if listener in self.listeners:
+			self.listeners.remove(listener)
 
-	def read(self):
+	def read(self) -> RX_RECORD:
+		'Waits for received chunk: (timestamp_ns, data)'
 		return self.rx_queue.get()
 
+	def read_all(self) -> Iterable[RX_RECORD]:
+		'Drains all received chunks (timestamp_ns, data) without blocking; re-arms RX notification'
+		self._notify_pending = False
+		records = self.rx_queue.get_all()
+		if records:
+			self.counters.drained(time.monotonic_ns() - records[0][0])
+		return records
+
+	def _take_tx(self, timeout: Optional[float]=None):
+		'Gets queued TX data, coalesced when queue is backed up; None if queue is empty'
+		try:
+			data = self.tx_queue.get(timeout is not None, timeout)
+		except queue.Empty:
+			return None
+		if not self.tx_queue.empty():
+			# coalesce backed up writes
+			chunks = [data]
+			size = len(data)
+			while size < TX_COALESCE_LIMIT:
+				try:
+					data = self.tx_queue.get_nowait()
+				except queue.Empty:
+					break
+				chunks.append(data)
+				size += len(data)
+			data = b''.join(chunks)
+		return data
+
+	def _deliver(self, timestamp_ns: int, data: bytes):
+		'Queues received chunk and notifies when no notification is pending'
+		start = tracer.begin()
+		self.counters.received(len(data))
+		if self.listeners:
+			self._notify_listeners(RX, timestamp_ns, data)
+		self.rx_queue.put((timestamp_ns, data))
+		if self.notify and not self._notify_pending:
+			self._notify_pending = True
+			self.notified_ns = tracer.begin()
+			self.notify()
+		tracer.end('rx.deliver', start)
+
+	def _sent(self, data):
+		'Notifies listeners about chunk taken for TX'
+		self.counters.sent(len(data))
+		if self.listeners:
+			self._notify_listeners(TX, time.monotonic_ns(), data)
+
+	def _notify_listeners(self, direction: int, timestamp_ns: int, data):
+		for listener in self.listeners:
+			try:
+				listener(self, direction, timestamp_ns, data)
+			except Exception as e:
+				logging.warning(e)
+
+	def _failed(self, e: Exception):
+		logging.warning(e)
+		self.counters.failed(e)
+		self.serial.close()
+		self._is_open = False
+		self.stop_event.set()
+		if self.fail:
+			self.fail()
+
 	def _send(self):
 		logging.info('tx thread is started')
 		while not self.stop_event.is_set():
 			try:
-				data = self.tx_queue.get(True, 1)
-				logging.info('tx:' + data)
-				self.serial.write(data.encode())
-			except queue.Empty:
-				continue
+				data = self._take_tx(1)
+				if data is None:
+					continue
+				start = tracer.begin()
+				self._sent(data)
+				self.serial.write(data)
+				tracer.end('tx.write', start)
 			except IOError as e:
-				logging.warning(e)
-				self.serial.close()
-				self._is_open = False
-				self.stop_event.set()
-				if self.fail:
-					self.fail()
+				self._failed(e)
 
 		logging.info('tx thread exits')
 
+	def _read_chunk(self) -> Tuple[int, bytes]:
+		'''Blocks for the first byte, then reads the burst until line is idle or chunk is full.
+		Gets (timestamp_ns of the first byte, data)'''
+		data = self.serial.read(1)
+		timestamp_ns = time.monotonic_ns()
+		if not data:
+			return timestamp_ns, data
+		waiting = self.serial.in_waiting
+		while waiting + 1 < self.read_size:
+			self.stop_event.wait(self.inter_byte_timeout)
+			was_waiting, waiting = waiting, self.serial.in_waiting
+			if waiting == was_waiting:
+				# line is idle
+				break
+		if waiting:
+			data += self.serial.read(waiting)
+		return timestamp_ns, data
+
 	def _recv(self):
 		logging.info('rx thread is started')
 		while not self.stop_event.is_set():
 			try:
-				data = self.serial.read(1024)
+				start = tracer.begin()
+				timestamp_ns, data = self._read_chunk()
+				tracer.end('rx.read', start)
 
 				if data and len(data) > 0:
-					data = data
-					# logging.info('rx:' + data)
-					self.rx_queue.put(data)
-					if self.notify:
-						self.notify()
+					self._deliver(timestamp_ns, data)
 			except IOError as e:
-				logging.warning(e)
-				self.serial.close()
-				self._is_open = False
-				self.stop_event.set()
-				if self.fail:
-					self.fail()
+				self._failed(e)
 
 		logging.info('rx thread exits')
 
@@ -239,6 +408,6 @@ if __name__ == '__main__':
 		s.start(parameters=p, vid_pid=vidpid_list)
 		print('Opened port: '+s.port_and_properties)
 		while True:
-			print(s.read())
+			print(s.read()[1])
 	except Exception as e:
 		print(e)
@@ -0,0 +1,176 @@
+from typing import Callable, Dict, List, Optional, Tuple
+
+import os
+import time
+import selectors
+import threading
+import logging
+
+from pqcom.serial_bus import SerialBus, READ_SIZE_MAX
+from pqcom.tracer import tracer
+
+
+class SelectorEngine(object):
+	'''One thread RX/TX for many SerialBus ports: selectors over the serial port file descriptors (POSIX).
+	SerialBus(engine=SelectorEngine()) keeps its write/read/on_received/on_failed contract.'''
+
+	def __init__(self):
+		self._selector: Optional[selectors.BaseSelector] = None
+		self._thread: Optional[threading.Thread] = None
+		self._lock = threading.Lock()
+		self._ops: List[Tuple[Callable, Optional[threading.Event]]] = []
+		self._wake_r = -1
+		self._wake_w = -1
+		self._stopping = False
+		self._fds: Dict[SerialBus, int] = {}
+		self._tx: Dict[SerialBus, memoryview] = {}
+
+	@staticmethod
+	def is_supported() -> bool:
+		return os.name == 'posix'
+
+	def add(self, bus: SerialBus):
+		'Starts RX/TX of opened port'
+		self._call(lambda: self._register(bus), wait=True)
+
+	def remove(self, bus: SerialBus):
+		'Stops RX/TX of port; port is not closed'
+		if self._thread:
+			self._call(lambda: self._unregister(bus), wait=True)
+
+	def want_write(self, bus: SerialBus):
+		'Wakes TX of port with queued data'
+		self._call(lambda: self._update(bus))
+
+	def stop(self):
+		if self._thread and self._thread is not threading.current_thread():
+			self._stopping = True
+			self._wake()
+			self._thread.join()
+			self._thread = None
+			self._selector.close()
+			os.close(self._wake_r)
+			os.close(self._wake_w)
+
+	def _start(self):
+		with self._lock:
+			if self._thread:
+				return
+			self._stopping = False
+			self._selector = selectors.DefaultSelector()
+			self._wake_r, self._wake_w = os.pipe()
+			os.set_blocking(self._wake_r, False)
+			os.set_blocking(self._wake_w, False)
+			self._selector.register(self._wake_r, selectors.EVENT_READ)
+			self._thread = threading.Thread(target=self._run, daemon=True)
+			self._thread.start()
+
+	def _call(self, func: Callable, wait=False):
+		'Runs func in engine thread: selector is changed by engine thread only'
+		if self._thread is threading.current_thread():
+			func()
+			return
+		self._start()
+		done = threading.Event() if wait else None
+		with self._lock:
+			self._ops.append((func, done))
+		self._wake()
+		if done:
+			done.wait()
+
+	def _wake(self):
+		try:
+			os.write(self._wake_w, b'\0')
+		except BlockingIOError:
+			# pipe is full: engine is woken anyway
+			pass
+
+	def _register(self, bus: SerialBus):
+		fd = bus.serial.fileno()
+		self._fds[bus] = fd
+		self._selector.register(fd, selectors.EVENT_READ, bus)
+		self._update(bus)
+
+	def _unregister(self, bus: SerialBus):
+		fd = self._fds.pop(bus, None)
+		self._tx.pop(bus, None)
+		if fd is not None:
+			try:
+				self._selector.unregister(fd)
+			except (KeyError, ValueError):
+				pass
+
+	def _update(self, bus: SerialBus):
+		'Selects port for write while it has TX data'
+		fd = self._fds.get(bus)
+		if fd is None:
+			return
+		events = selectors.EVENT_READ
+		if bus in self._tx or not bus.tx_queue.empty():
+			events |= selectors.EVENT_WRITE
+		if self._selector.get_key(fd).events != events:
+			self._selector.modify(fd, events, bus)
+
+	def _on_readable(self, bus: SerialBus, fd: int):
+		start = tracer.begin()
+		# all of the backlog is read at once as the RX thread does: a chunk per read size is slow
+		size = min(READ_SIZE_MAX, max(bus.read_size, bus.serial.in_waiting))
+		try:
+			data = os.read(fd, size)
+		except BlockingIOError:
+			return
+		tracer.end('rx.read', start)
+		if not data:
+			raise IOError('device reports readiness to read but returned no data '
+				'(device disconnected or multiple access on port?)')
+		bus._deliver(time.monotonic_ns(), data)
+
+	def _on_writable(self, bus: SerialBus, fd: int):
+		view = self._tx.pop(bus, None)
+		if view is None:
+			data = bus._take_tx()
+			if data is not None:
+				bus._sent(data)
+				view = memoryview(data).cast('B')
+		if view is not None:
+			start = tracer.begin()
+			try:
+				view = view[os.write(fd, view):]
+			except BlockingIOError:
+				pass
+			tracer.end('tx.write', start)
+			if len(view):
+				self._tx[bus] = view
+		self._update(bus)
+
+	def _run(self):
+		logging.info('selector engine thread is started')
+		while not self._stopping:
+			for key, events in self._selector.select():
+				if key.fd == self._wake_r:
+					try:
+						while os.read(self._wake_r, 4096):
+							pass
+					except BlockingIOError:
+						pass
+					continue
+				bus = key.data
+				try:
+					if events & selectors.EVENT_READ:
+						self._on_readable(bus, key.fd)
+					if events & selectors.EVENT_WRITE and bus in self._fds:
+						self._on_writable(bus, key.fd)
+				except IOError as e:
+					self._unregister(bus)
+					bus._failed(e)
+			with self._lock:
+				ops, self._ops = self._ops, []
+			for func, done in ops:
+				try:
+					func()
+				except Exception as e:
+					logging.warning(e)
+				finally:
+					if done:
+						done.set()
+		logging.info('selector engine thread exits')
@@ -0,0 +1,138 @@
+'''Persistent store of collections & send history: SQLite in WAL mode.
+
+Each change is one small transaction, so concurrent pqcom processes add & remove their items
+without overwriting the whole data of each other. Collections of the legacy pickle file are imported once.
+'''
+
+from typing import List, Optional, Tuple
+
+import os
+import pickle
+import sqlite3
+import logging
+
+
+STORE_FILE = os.path.join(os.path.expanduser('~'), '.pqcom.sqlite3')
+LEGACY_DATA_FILE = os.path.join(os.path.expanduser('~'), '.pqcom_data3')
+
+BUSY_TIMEOUT = 5.0 # s; other process writes
+
+# schema version -> statements upgrading from the previous version
+MIGRATIONS = {
+	1: (
+		'CREATE TABLE collections (id INTEGER PRIMARY KEY, form TEXT NOT NULL, raw TEXT NOT NULL, payload BLOB, '
+			'UNIQUE (form, raw))',
+		# seq: increasing send order, the most recent item has the largest one
+		'CREATE TABLE history (seq INTEGER NOT NULL, form TEXT NOT NULL, raw TEXT NOT NULL, payload BLOB, '
+			'PRIMARY KEY (form, raw))',
+		'CREATE INDEX history_seq ON history (seq)',
+	),
+}
+SCHEMA_VERSION = max(MIGRATIONS)
+
+ITEM = Tuple[str, str] # form, raw
+
+
+def read_legacy(path: str) -> Tuple[List[ITEM], List[ITEM]]:
+	'Gets collections & history (the least recent item first) of the legacy pickle file'
+	try:
+		with open(path, 'rb') as f:
+			data = pickle.load(f)
+	except (IOError, EOFError, pickle.UnpicklingError, AttributeError, ImportError) as e:
+		logging.debug('legacy data: %s', e)
+		return [], []
+	if isinstance(data, list):
+		# collections only
+		data = {'collections': data}
+	return ([(item[0], item[1]) for item in data.get('collections', [])],
+		[(item[0], item[1]) for item in data.get('history', [])])
+
+
+class Store(object):
+	'Collections & send history of all pqcom processes'
+
+	def __init__(self, path: str=STORE_FILE, legacy_path: Optional[str]=LEGACY_DATA_FILE):
+		self._db: Optional[sqlite3.Connection] = None
+		try:
+			self._db = self._open(path)
+			self._migrate(legacy_path)
+		except sqlite3.Error as e:
+			logging.warning('Store {} is not available, data are not saved: {}'.format(path, e))
+			if self._db:
+				self._db.close()
+			self._db = self._open(':memory:')
+			self._migrate(None)
+
+	@staticmethod
+	def _open(path: str) -> sqlite3.Connection:
+		# autocommit: transactions are explicit
+		db = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None)
+		db.execute('PRAGMA journal_mode=WAL')
+		db.execute('PRAGMA synchronous=NORMAL')
+		return db
+
+	def _migrate(self, legacy_path: Optional[str]):
+		db = self._db
+		db.execute('BEGIN IMMEDIATE')
+		try:
+			version = db.execute('PRAGMA user_version').fetchone()[0]
+			if version > SCHEMA_VERSION:
+				raise sqlite3.DatabaseError('Store schema {} is newer than {}'.format(version, SCHEMA_VERSION))
+			for v in range(version + 1, SCHEMA_VERSION + 1):
+				for statement in MIGRATIONS[v]:
+					db.execute(statement)
+			if version == 0 and legacy_path:
+				collections, history = read_legacy(legacy_path)
+				db.executemany('INSERT OR IGNORE INTO collections (form, raw) VALUES (?, ?)', collections)
+				db.executemany('INSERT OR REPLACE INTO history (seq, form, raw) VALUES (?, ?, ?)',
+					[(seq, form, raw) for seq, (form, raw) in enumerate(history)])
+			db.execute('PRAGMA user_version = {}'.format(SCHEMA_VERSION))
+			db.execute('COMMIT')
+		except sqlite3.Error:
+			db.execute('ROLLBACK')
+			raise
+
+	def close(self):
+		self._db.close()
+
+	def _write(self, *statements: Tuple[str, tuple]):
+		'Runs statements (sql, parameters) in one transaction; errors are logged only: GUI keeps working'
+		db = self._db
+		try:
+			db.execute('BEGIN IMMEDIATE')
+			try:
+				for sql, parameters in statements:
+					db.execute(sql, parameters)
+				db.execute('COMMIT')
+			except sqlite3.Error:
+				db.execute('ROLLBACK')
+				raise
+		except sqlite3.Error as e:
+			logging.warning('Store write failed: %s', e)
+
+	def collections(self) -> List[ITEM]:
+		return self._db.execute('SELECT form, raw FROM collections ORDER BY id').fetchall()
+
+	def add_collection(self, form: str, raw: str, payload: Optional[bytes]=None):
+		self._write(('INSERT OR IGNORE INTO collections (form, raw, payload) VALUES (?, ?, ?)', (form, raw, payload)))
+
+	def remove_collection(self, form: str, raw: str):
+		self._write(('DELETE FROM collections WHERE form = ? AND raw = ?', (form, raw)))
+
+	def remove_all_collections(self):
+		self._write(('DELETE FROM collections', ()))
+
+	def history(self, limit: int) -> List[ITEM]:
+		'Gets up to limit of the most recent items, the least recent item first'
+		rows = self._db.execute('SELECT form, raw FROM history ORDER BY seq DESC LIMIT ?', (limit,)).fetchall()
+		rows.reverse()
+		return rows
+
+	def add_history(self, form: str, raw: str, payload: Optional[bytes]=None, limit: Optional[int]=None):
+		'Moves or inserts the most recent item; the least recent items over limit are dropped'
+		statements = [('INSERT OR REPLACE INTO history (seq, form, raw, payload) '
+			'VALUES ((SELECT IFNULL(MAX(seq), 0) + 1 FROM history), ?, ?, ?)', (form, raw, payload))]
+		if limit:
+			statements.append(('DELETE FROM history WHERE seq <= '
+				'(SELECT seq FROM history ORDER BY seq DESC LIMIT 1 OFFSET ?)', (limit,)))
+		self._write(*statements)
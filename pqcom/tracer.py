@@ -0,0 +1,72 @@
+'''Span tracer of the RX/TX hot paths: per-stage durations kept in a ring buffer, dumped as Chrome trace JSON
+(chrome://tracing, https://ui.perfetto.dev).
+
+Disabled tracer costs an attribute check per span:
+
+	start = tracer.begin()
+	...
+	tracer.end('rx.deliver', start)
+'''
+
+from typing import Dict, Optional
+
+import os
+import json
+import time
+import threading
+import collections
+
+
+TRACE_CAPACITY = 256 * 1024 # spans; the oldest spans are dropped
+
+
+class Tracer(object):
+	'Records spans (name, thread, start, duration) of all threads; deque append is atomic'
+
+	def __init__(self, capacity: int=TRACE_CAPACITY):
+		self.enabled = False
+		self._spans: 'collections.deque' = collections.deque(maxlen=capacity)
+		self._threads: Dict[int, str] = {} # thread id -> name
+
+	def enable(self, capacity: Optional[int]=None):
+		if capacity:
+			self._spans = collections.deque(self._spans, maxlen=capacity)
+		self.enabled = True
+
+	def disable(self):
+		self.enabled = False
+
+	def clear(self):
+		self._spans.clear()
+
+	def __len__(self) -> int:
+		return len(self._spans)
+
+	def begin(self) -> int:
+		'Gets span start, ns; 0 if disabled'
+		return time.perf_counter_ns() if self.enabled else 0
+
+	def end(self, name: str, start_ns: int):
+		'Records span of name from start_ns of begin() till now'
+		if start_ns and self.enabled:
+			tid = threading.get_ident()
+			if tid not in self._threads:
+				self._threads[tid] = threading.current_thread().name
+			self._spans.append((name, tid, start_ns, time.perf_counter_ns() - start_ns))
+
+	def to_chrome_trace(self) -> dict:
+		'Gets spans as Chrome trace events: complete events, us'
+		pid = os.getpid()
+		events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+			for tid, name in list(self._threads.items())]
+		events.extend({'name': name, 'cat': name.split('.', 1)[0], 'ph': 'X', 'pid': pid, 'tid': tid,
+			'ts': start_ns / 1000, 'dur': duration_ns / 1000} for name, tid, start_ns, duration_ns in list(self._spans))
+		return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+	def dump(self, path: str):
+		with open(path, 'w') as f:
+			json.dump(self.to_chrome_trace(), f)
+
+
+# process wide tracer of pqcom modules
+tracer = Tracer()
@@ -1,16 +1,19 @@
 
 import sys
 import os
-import pkg_resources
+import functools
 
 VERSION = '0.6.0'
 
 script_path = os.path.dirname(sys.argv[0])
 
+@functools.lru_cache(maxsize=None)
 def resource_path(relative_path):
 	base_path = getattr(sys, '_MEIPASS', script_path)
 	full_path = os.path.join(base_path, relative_path)
 	if os.path.isfile(full_path):
 		return full_path
 	else:
-		return pkg_resources.resource_filename(__name__, relative_path)
+		# package data: importlib.resources is imported only when needed
+		from importlib import resources
+		return str(resources.files(__package__).joinpath(relative_path))
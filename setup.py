@@ -64,7 +64,10 @@ setup(
     # pip to create the appropriate form of executable for the target platform.
     entry_points={
         'gui_scripts': [
-            'pqcom=pqcom.main:main',
+            'pqcom=pqcom.cli:main',
+        ],
+        'console_scripts': [
+            'pqcom-cli=pqcom.cli:main',
         ],
     },
 )
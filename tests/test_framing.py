@@ -0,0 +1,204 @@
+import pytest
+
+from pqcom import framing
+
+
+INPUT_TYPES = (bytes, bytearray, memoryview)
+
+
+def feed_all(framer, chunks, data_type=bytes):
+	'Feeds chunks stamped by their index; gets frames'
+	ret = []
+	for i, chunk in enumerate(chunks):
+		ret.extend(framer.feed(i, data_type(chunk)))
+	return ret
+
+def frames_of(framer, chunks, data_type=bytes):
+	return [frame for _, frame in feed_all(framer, chunks, data_type)]
+
+
+@pytest.mark.parametrize('data_type', INPUT_TYPES)
+def test_delimiter_split_across_chunks(data_type):
+	framer = framing.DelimiterFramer(b'\r\n')
+	assert feed_all(framer, [b'ab\r', b'\ncd', b'e\r\nf'], data_type) == [(0, b'ab\r\n'), (1, b'cde\r\n')]
+	assert framer.pending == 1
+	assert framer.flush() == [(2, b'f')]
+	assert framer.pending == 0
+
+def test_delimiter_memoryview_slice():
+	framer = framing.DelimiterFramer()
+	assert framer.feed(0, memoryview(b'XXXXab\ncd\n')[4:]) == [(0, b'ab\n'), (0, b'cd\n')]
+
+def test_delimiter_memoryview_slice_after_incomplete_frame():
+	framer = framing.DelimiterFramer()
+	assert framer.feed(0, memoryview(b'\nXab')[2:]) == []
+	assert framer.feed(1, memoryview(b'\n\ncd\nZ')[1:5]) == [(0, b'ab\n'), (1, b'cd\n')]
+
+def test_delimiter_max_size():
+	framer = framing.DelimiterFramer(max_size=4)
+	assert frames_of(framer, [b'abcdefg', b'h\nij\n']) == [b'abcd', b'efgh', b'\n', b'ij\n']
+
+def test_delimiter_reset():
+	framer = framing.DelimiterFramer()
+	framer.feed(0, b'abc')
+	framer.reset()
+	assert framer.pending == 0
+	assert framer.flush() == []
+	assert framer.feed(1, b'd\n') == [(1, b'd\n')]
+
+def test_delimiter_empty():
+	with pytest.raises(ValueError):
+		framing.DelimiterFramer(b'')
+
+
+@pytest.mark.parametrize('data_type', INPUT_TYPES)
+def test_length_split_across_chunks(data_type):
+	framer = framing.LengthFramer(2, 'big')
+	frames = frames_of(framer, [b'\x00', b'\x03ab', b'c\x00\x01d\x00'], data_type)
+	assert frames == [b'\x00\x03abc', b'\x00\x01d']
+	assert framer.pending == 1
+
+def test_length_offset_adjust_little():
+	framer = framing.LengthFramer(1, 'little', offset=1, adjust=1)
+	assert frames_of(framer, [b'\xaa\x01xy\xbb']) == [b'\xaa\x01xy']
+
+def test_length_max_size():
+	framer = framing.LengthFramer(1, max_size=2)
+	assert frames_of(framer, [b'\x05abcd']) == [b'\x05ab']
+	assert framer.flush() == [(0, b'cd')]
+
+def test_length_memoryview_slice():
+	framer = framing.LengthFramer(1)
+	assert frames_of(framer, [memoryview(b'\x09\x09\x01a\x01b')[2:]], memoryview) == [b'\x01a', b'\x01b']
+
+def test_length_wrong_field():
+	with pytest.raises(ValueError):
+		framing.LengthFramer(3)
+
+
+@pytest.mark.parametrize('data_type', INPUT_TYPES)
+def test_slip_escapes_split_across_chunks(data_type):
+	framer = framing.SlipFramer()
+	# ESC_END split between chunks, empty frames between ENDs are skipped
+	frames = frames_of(framer, [b'\xc0a\xdb', b'\xdcb\xdb\xddc\xc0\xc0', b'd\xc0'], data_type)
+	assert frames == [b'a\xc0b\xdbc', b'd']
+
+def test_slip_memoryview_slice():
+	framer = framing.SlipFramer()
+	assert frames_of(framer, [memoryview(b'x\xc0yz\xc0ab\xc0')[3:]], memoryview) == [b'z', b'ab']
+
+def test_slip_max_size():
+	framer = framing.SlipFramer(max_size=3)
+	assert frames_of(framer, [b'abcd']) == []
+	assert framer.errors == 1
+	assert framer.pending == 0
+	assert frames_of(framer, [b'ef\xc0']) == [b'ef']
+
+
+def cobs_encode(data: bytes) -> bytes:
+	ret = bytearray()
+	for block in data.split(b'\0'):
+		while len(block) >= 0xFE:
+			ret += b'\xff' + block[:0xFE]
+			block = block[0xFE:]
+		ret += bytes([len(block) + 1]) + block
+	return bytes(ret)
+
+@pytest.mark.parametrize('data_type', INPUT_TYPES)
+def test_cobs_split_across_chunks(data_type):
+	framer = framing.CobsFramer()
+	encoded = cobs_encode(b'\x11\x00\x22\x00') + b'\0' + cobs_encode(b'abc') + b'\0'
+	frames = frames_of(framer, [encoded[:3], encoded[3:7], encoded[7:]], data_type)
+	assert frames == [b'\x11\x00\x22\x00', b'abc']
+
+def test_cobs_long_block():
+	framer = framing.CobsFramer()
+	data = bytes(range(1, 256)) * 2
+	assert frames_of(framer, [cobs_encode(data) + b'\0']) == [data]
+
+def test_cobs_malformed():
+	framer = framing.CobsFramer()
+	assert frames_of(framer, [b'\x05ab\0\x02x\0']) == [b'x']
+	assert framer.errors == 1
+
+def test_cobs_memoryview_slice():
+	framer = framing.CobsFramer()
+	assert frames_of(framer, [memoryview(b'\x02z\0\x02y\0')[3:]], memoryview) == [b'y']
+
+def test_cobs_max_size():
+	framer = framing.CobsFramer(max_size=3)
+	assert frames_of(framer, [b'\x05abcd']) == []
+	assert framer.errors == 1
+	assert frames_of(framer, [b'\x02a\0']) == [b'a']
+
+
+@pytest.mark.parametrize('data_type', INPUT_TYPES)
+def test_fixed_split_across_chunks(data_type):
+	framer = framing.FixedFramer(3)
+	assert feed_all(framer, [b'ab', b'cdefg', b'hi'], data_type) == [(0, b'abc'), (1, b'def'), (1, b'ghi')]
+	assert framer.flush() == []
+
+def test_fixed_memoryview_slice():
+	framer = framing.FixedFramer(2)
+	assert frames_of(framer, [memoryview(b'XXabcd')[2:]], memoryview) == [b'ab', b'cd']
+
+def test_fixed_flush_reset():
+	framer = framing.FixedFramer(4)
+	framer.feed(0, b'ab')
+	assert framer.flush() == [(0, b'ab')]
+	framer.feed(1, b'cd')
+	framer.reset()
+	assert framer.feed(2, b'efgh') == [(2, b'efgh')]
+
+def test_fixed_wrong_size():
+	with pytest.raises(ValueError):
+		framing.FixedFramer(0)
+
+
+@pytest.mark.parametrize('data_type', INPUT_TYPES)
+def test_idle_gap(data_type):
+	framer = framing.IdleGapFramer(0.01)
+	assert framer.feed(0, data_type(b'ab')) == []
+	assert framer.feed(5000000, data_type(b'cd')) == []
+	# the gap is counted from the last chunk
+	assert framer.poll(14000000) == []
+	assert framer.poll(15000000) == [(0, b'abcd')]
+	assert framer.poll(30000000) == []
+
+def test_idle_gap_next_chunk_ends_frame():
+	framer = framing.IdleGapFramer(0.01)
+	framer.feed(0, b'ab')
+	assert framer.feed(20000000, b'cd') == [(0, b'ab')]
+	assert framer.flush() == [(20000000, b'cd')]
+
+def test_idle_gap_max_size():
+	framer = framing.IdleGapFramer(1, max_size=2)
+	assert frames_of(framer, [b'abc', b'de']) == [b'ab', b'cd']
+	assert framer.pending == 1
+
+def test_idle_gap_memoryview_slice():
+	framer = framing.IdleGapFramer(0.01)
+	framer.feed(0, memoryview(b'XXab')[2:])
+	assert framer.poll(10000000) == [(0, b'ab')]
+
+
+@pytest.mark.parametrize('spec, framer_type', [
+	('delimiter', framing.DelimiterFramer),
+	('delimiter:0d0a', framing.DelimiterFramer),
+	('length:2:little:1:0', framing.LengthFramer),
+	('slip', framing.SlipFramer),
+	('cobs', framing.CobsFramer),
+	('fixed:8', framing.FixedFramer),
+	('idle:0.05', framing.IdleGapFramer),
+])
+def test_create_framer(spec, framer_type):
+	assert isinstance(framing.create_framer(spec), framer_type)
+
+@pytest.mark.parametrize('spec', ['unknown', 'fixed', 'slip:1', 'idle', 'length:3'])
+def test_create_framer_wrong(spec):
+	with pytest.raises(ValueError):
+		framing.create_framer(spec)
+
+def test_create_framer_none():
+	assert framing.create_framer(None) is None
+	assert framing.create_framer('none') is None